@@ -1,226 +1,170 @@
-from flask import Flask, render_template, request, jsonify, session
-import pandas as pd
+from flask import Flask, render_template, request, jsonify, session, Response, stream_with_context, g
 import os
-import re
+import json
+import time
+import threading
 from datetime import datetime
 import base64
+import hmac
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.wsgi import get_input_stream
+from session_store import create_session_store
+from catalog import DEFAULT_CSV_PATH, catalog_version
+from mood_recommender import build_recommender, encode_json
+from response_cache import ResponseCache
+import emotion
+import metrics
+from emotion_stream import EmotionStreamHub, FrameStreamError, read_frames
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-for-sessions-12345'  # Required for session management
 
-# Load the dataset
-DATA_PATH = 'data/spotify_mood_tracks_multilang.csv'
+# Load the dataset (CATALOG_PATH points at another tracks CSV, e.g. a synthetic benchmark catalog)
+DATA_PATH = os.environ.get('CATALOG_PATH', DEFAULT_CSV_PATH)
 
-# Store conversation history (in production, use Redis or database)
-conversation_history = {}
+# Store conversation history, bounded by session count and idle time.
+# SESSION_BACKEND=sqlite shares sessions between worker processes on one host.
+conversation_history = create_session_store(
+    os.environ.get('SESSION_BACKEND', 'memory'),
+    path=os.environ.get('SESSION_DB_PATH', 'sessions.sqlite3'),
+    max_sessions=int(os.environ.get('SESSION_MAX', 10000)),
+    ttl_seconds=int(os.environ.get('SESSION_TTL_SECONDS', 1800))
+)
 
-class MoodBasedRecommender:
-    def __init__(self, tracks_df):
-        self.tracks_df = tracks_df
-        
-        # Language detection patterns
-        self.language_patterns = {
-            'Hindi': [
-                r'\b(hai|hain|kya|kaise|mujhe|mere|tera|tere|bahut|accha|bura|khush|udaas|dukhi|' +
-                r'pyaar|mohabbat|dost|yaar|bhai|didi|maa|papa|ghar|kaam|padhai|gaana|' +
-                r'सुनना|गाना|खुश|उदास|दुखी|प्यार|मोहब्बत|दोस्त)\b'
-            ],
-            'Telugu': [
-                r'[\u0C00-\u0C7F]+',  # Telugu script
-                r'\b(nenu|naaku|meeku|ela|enti|bagundi|ledhu|kavali|anthe)\b'
-            ],
-            'Tamil': [
-                r'[\u0B80-\u0BFF]+',  # Tamil script
-                r'\b(naan|enakku|unakku|epdi|enna|nalla|illa|venum|sari)\b'
-            ],
-            'Malayalam': [
-                r'[\u0D00-\u0D7F]+',  # Malayalam script
-                r'\b(njan|enikku|ningalkku|engane|enthu|nannaayi|illa|venam|sheriyaanu)\b'
-            ],
-            'Kannada': [
-                r'[\u0C80-\u0CFF]+',  # Kannada script
-                r'\b(naanu|nanage|nimage|hege|yenu|chennagide|illa|beku|sari)\b'
-            ]
-        }
-        
-        # Mood detection keywords (English + Hinglish)
-        self.mood_keywords = {
-            'Happy': [
-                'happy', 'joy', 'excited', 'great', 'awesome', 'wonderful', 'amazing', 'fantastic',
-                'khush', 'mast', 'mazaa', 'maja', 'party', 'celebrate', 'celebration', 'fun',
-                'cheerful', 'delighted', 'pleased', 'glad', 'joyful', 'ecstatic', 'blessed'
-            ],
-            'Sad': [
-                'sad', 'unhappy', 'depressed', 'down', 'upset', 'hurt', 'pain', 'crying',
-                'udaas', 'dukhi', 'dard', 'rona', 'breakup', 'heartbreak', 'lonely', 'alone',
-                'miss', 'missing', 'cry', 'tears', 'lost', 'broken', 'disappointed'
-            ],
-            'Energetic': [
-                'energy', 'energetic', 'pump', 'workout', 'gym', 'exercise', 'run', 'active',
-                'power', 'strong', 'intense', 'adrenaline', 'beast mode', 'fired up',
-                'josh', 'full energy', 'workout karna hai', 'gym jaana', 'dance', 'jumping'
-            ],
-            'Calm': [
-                'calm', 'peace', 'peaceful', 'relax', 'relaxed', 'chill', 'meditation', 'quiet',
-                'shanti', 'aram', 'rest', 'sleep', 'soothing', 'gentle', 'soft', 'tranquil',
-                'serene', 'peaceful', 'stress free', 'tension free', 'breathe'
-            ],
-            'Romantic': [
-                'love', 'romance', 'romantic', 'crush', 'date', 'valentine', 'heart', 'lover',
-                'pyaar', 'mohabbat', 'ishq', 'dil', 'girlfriend', 'boyfriend', 'propose',
-                'kiss', 'hug', 'baby', 'sweetheart', 'darling', 'beautiful', 'handsome'
-            ],
-            'Motivated': [
-                'motivated', 'motivation', 'inspire', 'success', 'goal', 'achieve', 'hustle',
-                'grind', 'focus', 'determination', 'dream', 'ambition', 'winner', 'champion',
-                'improve', 'better', 'growth', 'progress', 'never give up', 'keep going'
-            ],
-            'Party': [
-                'party', 'club', 'dance', 'dj', 'drinks', 'night out', 'clubbing', 'vibes',
-                'lit', 'turn up', 'bass', 'edm', 'beat', 'drop', 'festival', 'rave',
-                'friends', 'gang', 'wild', 'crazy night', 'dance floor', 'nightlife'
-            ],
-            'Focus': [
-                'study', 'work', 'focus', 'concentrate', 'concentration', 'exam', 'office',
-                'productive', 'productivity', 'reading', 'coding', 'assignment', 'project',
-                'deadline', 'padhai', 'kaam', 'working', 'studying', 'learn', 'learning'
-            ]
-        }
-    
-    def detect_language_preference_from_text(self, text):
-        """Detect language preference from English conversation (e.g., 'hindi songs', 'tamil music')"""
-        text_lower = text.lower()
-        
-        # Check for explicit language mentions in English
-        language_mentions = {
-            'Hindi': ['hindi', 'bollywood', 'hindustani'],
-            'Telugu': ['telugu', 'tollywood'],
-            'Tamil': ['tamil', 'kollywood'],
-            'Malayalam': ['malayalam', 'mollywood'],
-            'Kannada': ['kannada', 'sandalwood'],
-            'English': ['english', 'western', 'international']
-        }
-        
-        for language, keywords in language_mentions.items():
-            for keyword in keywords:
-                if keyword in text_lower:
-                    return language
-        
-        # If no specific language mentioned, return None (will use All)
-        return None
-    
-    def detect_mood_from_text(self, text, conversation_context=None):
-        """Detect mood from user message using keyword matching with context"""
-        text_lower = text.lower()
-        
-        # If there's conversation context, consider previous mood
-        previous_mood = None
-        if conversation_context and len(conversation_context) > 0:
-            last_exchange = conversation_context[-1]
-            previous_mood = last_exchange.get('detected_mood')
-        
-        mood_scores = {}
-        
-        # Count keyword matches for each mood
-        for mood, keywords in self.mood_keywords.items():
-            score = 0
-            for keyword in keywords:
-                if keyword in text_lower:
-                    score += 1
-            
-            # Boost score if it's a continuation of previous mood
-            if previous_mood == mood and score == 0:
-                # Check for continuation phrases
-                continuation_phrases = ['yes', 'yeah', 'yep', 'ha', 'haan', 'more', 'another', 
-                                       'similar', 'like that', 'same', 'continue', 'and', 'also']
-                for phrase in continuation_phrases:
-                    if phrase in text_lower:
-                        score += 2  # Boost previous mood
-                        break
-        
-            mood_scores[mood] = score
-        
-        # Get mood with highest score
-        if max(mood_scores.values()) > 0:
-            detected_mood = max(mood_scores, key=mood_scores.get)
-            return detected_mood
-        
-        # If no keywords matched, use previous mood if available
-        if previous_mood:
-            return previous_mood
-        
-        # Default to Happy if no keywords matched
-        return 'Happy'
+def get_catalog_version(path=DATA_PATH):
+    """Version of the catalog on disk (the CSV, or the compiled catalog shipped without it)"""
+    return catalog_version(path)
+
+# Catalog reload bookkeeping, reported at /health
+_reload_lock = threading.Lock()
+catalog_reload_status = {'reloads': 0, 'in_progress': False, 'last_error': None}
+
+def reload_catalog():
+    """Build a recommender for the catalog on disk and swap it in
     
-    def recommend_by_mood_and_language(self, mood, language=None, n_recommendations=10):
-        """Get top recommendations for a specific mood and optional language"""
-        # Filter by mood
-        mood_tracks = self.tracks_df[self.tracks_df['mood'] == mood]
-        
-        # Filter by language if specified
-        if language and language != 'All':
-            mood_tracks = mood_tracks[mood_tracks['language'] == language]
-        
-        if len(mood_tracks) == 0:
-            return None
-        
-        # Sort by popularity and get top N
-        top_tracks = mood_tracks.nlargest(n_recommendations, 'popularity')
-        return top_tracks[['id', 'name', 'artist', 'album', 'popularity', 'language']].to_dict('records')
-    
-    def get_all_tracks_for_mood_language(self, mood, language=None, limit=50):
-        """Get all track IDs for a mood-language combination (for creating playlists)"""
-        # Filter by mood
-        mood_tracks = self.tracks_df[self.tracks_df['mood'] == mood]
-        
-        # Filter by language if specified
-        if language and language != 'All':
-            mood_tracks = mood_tracks[mood_tracks['language'] == language]
-        
-        if len(mood_tracks) == 0:
-            return []
-        
-        # Get top tracks by popularity
-        top_tracks = mood_tracks.nlargest(limit, 'popularity')
-        return top_tracks['id'].tolist()
-    
-    def get_available_moods(self):
-        """Get list of available moods with track counts"""
-        mood_counts = self.tracks_df['mood'].value_counts().to_dict()
-        return mood_counts
-    
-    def get_available_languages(self):
-        """Get list of available languages with track counts"""
-        language_counts = self.tracks_df['language'].value_counts().to_dict()
-        return language_counts
-    
-    def get_stats(self):
-        """Get dataset statistics"""
-        return {
-            'total_tracks': len(self.tracks_df),
-            'unique_artists': self.tracks_df['artist'].nunique(),
-            'unique_albums': self.tracks_df['album'].nunique(),
-            'avg_popularity': round(self.tracks_df['popularity'].mean(), 2),
-            'languages': len(self.tracks_df['language'].unique()),
-            'moods': len(self.tracks_df['mood'].unique())
-        }
+    The new instance is built while the old one keeps serving. Swapping is a single
+    reference assignment, and every route reads `recommender` once into a local, so
+    in-flight requests finish on the old catalog and new requests see the new one.
+    Returns False if a reload is already running.
+    """
+    global recommender
+    if not _reload_lock.acquire(blocking=False):
+        return False
+    catalog_reload_status['in_progress'] = True
+    try:
+        new_recommender = build_recommender(DATA_PATH)
+        recommender = new_recommender
+        if recommend_cache:
+            recommend_cache.set_version(new_recommender.catalog_version)
+        catalog_reload_status['reloads'] += 1
+        catalog_reload_status['last_error'] = None
+        print(f"✓ Catalog reloaded (version {new_recommender.catalog_version}, {new_recommender.load_seconds}s)")
+    except Exception as e:
+        catalog_reload_status['last_error'] = str(e)
+        print(f"Error reloading catalog: {e}")
+    finally:
+        catalog_reload_status['in_progress'] = False
+        _reload_lock.release()
+    return True
+
+def watch_catalog(interval):
+    """Reload the catalog whenever the file on disk changes"""
+    while True:
+        time.sleep(interval)
+        try:
+            version = get_catalog_version()
+        except OSError:
+            continue  # file is being replaced
+        if recommender is None or version != recommender.catalog_version:
+            reload_catalog()
 
 # Initialize recommender
 try:
-    tracks_df = pd.read_csv(DATA_PATH)
-    recommender = MoodBasedRecommender(tracks_df)
+    recommender = build_recommender(DATA_PATH)
     print("✓ Dataset loaded successfully!")
 except Exception as e:
     print(f"Error loading dataset: {e}")
     recommender = None
 
+# Emotion inference runs in a dedicated process pool (EMOTION_WORKERS, 0 = inline on the
+# request thread) with at most EMOTION_QUEUE_SIZE frames waiting; beyond that we answer 503.
+# Models are built once per process before the first frame (EMOTION_WARMUP=eager blocks
+# startup until ready, background warms in a thread, off waits for the first request).
+EMOTION_WARMUP = os.environ.get('EMOTION_WARMUP', 'background')
+
+# Streaming camera mode: clients push frames freely, the newest one per session is
+# analyzed once per EMOTION_STREAM_TICK_MS and the smoothed mood is sent over SSE.
+# An event stream or streamed upload holds a request thread while open, so at most
+# EMOTION_STREAM_MAX_CONNECTIONS are admitted (gunicorn.conf.py sets it to half of a
+# worker's threads, leaving the rest to /chat and /recommend); beyond that we answer 503.
+EMOTION_STREAM_MAX_FRAME_BYTES = 2 * 1024 * 1024
+emotion_streams = EmotionStreamHub(
+    emotion.detect_emotion,
+    tick_seconds=float(os.environ.get('EMOTION_STREAM_TICK_MS', 500)) / 1000,
+    alpha=float(os.environ.get('EMOTION_STREAM_ALPHA', 0.3)),
+    max_streams=int(os.environ.get('EMOTION_STREAM_MAX', 200)),
+    max_connections=int(os.environ.get('EMOTION_STREAM_MAX_CONNECTIONS', 32))
+)
+
+# Ready-to-send /recommend bodies per (mood, language, num_songs), dropped on catalog reload
+# (RECOMMEND_CACHE_MAX_BYTES=0 disables; RECOMMEND_CACHE_GZIP=0 skips the gzip copies)
+RECOMMEND_CACHE_MAX_BYTES = int(os.environ.get('RECOMMEND_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+recommend_cache = ResponseCache(
+    max_bytes=RECOMMEND_CACHE_MAX_BYTES,
+    compress=os.environ.get('RECOMMEND_CACHE_GZIP', 'True').lower() in ('1', 'true', 'yes')
+) if RECOMMEND_CACHE_MAX_BYTES > 0 else None
+
+# Largest number of queries accepted by /recommend/batch
+MAX_BATCH_QUERIES = 100
+# Largest JSON message list accepted by /chat/classify-batch (JSONL bodies are streamed, no cap)
+MAX_CLASSIFY_MESSAGES = int(os.environ.get('MAX_CLASSIFY_MESSAGES', 1000))
+
+# CATALOG_WATCH_INTERVAL=<seconds> polls the catalog file and hot-reloads it on change
+CATALOG_WATCH_INTERVAL = float(os.environ.get('CATALOG_WATCH_INTERVAL', 0))
+
+def start_services():
+    """Start this process's emotion inference and catalog watcher threads/processes"""
+    emotion.start(
+        workers=int(os.environ.get('EMOTION_WORKERS', 1)),
+        queue_size=int(os.environ.get('EMOTION_QUEUE_SIZE', 4)),
+        warmup_mode=EMOTION_WARMUP
+    )
+    if CATALOG_WATCH_INTERVAL > 0:
+        threading.Thread(target=watch_catalog, args=(CATALOG_WATCH_INTERVAL,), name='catalog-watch', daemon=True).start()
+
+# PRELOAD_APP=1 (set by gunicorn.conf.py): this module is imported once in the master and
+# workers are forked from it. Threads and process pools don't survive a fork, and the
+# emotion models shouldn't be loaded in the master, so each worker starts them after fork.
+PRELOAD_APP = os.environ.get('PRELOAD_APP', 'False').lower() in ('1', 'true', 'yes')
+# Pool workers started with spawn/forkserver import the main script again as __mp_main__
+if not PRELOAD_APP and __name__ != '__mp_main__':
+    start_services()
+
+if metrics.ENABLED:
+    @app.before_request
+    def start_request_timer():
+        g.request_start = time.perf_counter()
+    
+    @app.after_request
+    def record_request_metrics(response):
+        """Latency per route pattern (not raw path, so labels stay bounded) and error counts"""
+        start = g.pop('request_start', None)
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        status = str(response.status_code)
+        if start is not None:
+            metrics.request_seconds.observe(time.perf_counter() - start, route, request.method, status)
+        if response.status_code >= 400:
+            metrics.http_errors.inc(route, status)
+        return response
+
 @app.route('/')
 def home():
     """Home page"""
-    if recommender:
-        moods = recommender.get_available_moods()
-        languages = recommender.get_available_languages()
-        stats = recommender.get_stats()
+    rec = recommender
+    if rec:
+        moods = rec.get_available_moods()
+        languages = rec.get_available_languages()
+        stats = rec.get_stats()
         return render_template('index.html', moods=moods, languages=languages, stats=stats)
     else:
         return "Error: Dataset not found. Please run the notebook first to create the dataset."
@@ -228,16 +172,33 @@ def home():
 @app.route('/chat-page')
 def chat_page():
     """Chat interface page"""
-    if recommender:
-        languages = recommender.get_available_languages()
+    rec = recommender
+    if rec:
+        languages = rec.get_available_languages()
         return render_template('chat.html', languages=languages)
     else:
         return "Error: Dataset not found. Please run the notebook first to create the dataset."
 
+@metrics.timed('serialize')
+def fragment_response(payload, status=200):
+    """JSON response for a payload holding JSONFragments (see encode_json)"""
+    return Response(encode_json(payload) + '\n', status=status, mimetype='application/json')
+
+def cached_json_response(body, gzipped=None):
+    """Response for a prebuilt JSON body, sending the gzip copy to clients that accept it"""
+    if gzipped is not None and 'gzip' in request.accept_encodings:
+        response = Response(gzipped, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(body, mimetype='application/json')
+    response.vary.add('Accept-Encoding')
+    return response
+
 @app.route('/recommend', methods=['POST'])
 def recommend():
     """Get recommendations based on selected mood and language"""
-    if not recommender:
+    rec = recommender
+    if not rec:
         return jsonify({'error': 'Recommender not initialized'}), 500
     
     data = request.get_json()
@@ -245,30 +206,131 @@ def recommend():
     language = data.get('language', 'All')
     num_songs = int(data.get('num_songs', 10))
     
-    recommendations = recommender.recommend_by_mood_and_language(mood, language, num_songs)
+    cache_key = (mood, language, num_songs)
+    entry = recommend_cache.get(rec.catalog_version, cache_key) if recommend_cache else None
+    if entry is None:
+        recommendations = rec.recommend_json(mood, language, num_songs)
+        
+        if recommendations is None:
+            return jsonify({'error': f'No tracks found for mood: {mood} and language: {language}'}), 404
+        
+        response = fragment_response({
+            'mood': mood,
+            'language': language,
+            'count': len(recommendations),
+            'recommendations': recommendations
+        })
+        if not recommend_cache:
+            return response
+        entry = recommend_cache.put(rec.catalog_version, cache_key, response.get_data())
     
-    if recommendations is None:
-        return jsonify({'error': f'No tracks found for mood: {mood} and language: {language}'}), 404
+    return cached_json_response(*entry)
+
+@app.route('/recommend/batch', methods=['POST'])
+def recommend_batch():
+    """Get recommendations for a list of mood/language queries in one call"""
+    rec = recommender
+    if not rec:
+        return jsonify({'error': 'Recommender not initialized'}), 500
     
-    return jsonify({
-        'mood': mood,
-        'language': language,
-        'count': len(recommendations),
-        'recommendations': recommendations
-    })
+    data = request.get_json(silent=True) or {}
+    queries = data.get('queries')
+    if not isinstance(queries, list) or not queries:
+        return jsonify({'error': 'Provide a non-empty list of queries'}), 400
+    if len(queries) > MAX_BATCH_QUERIES:
+        return jsonify({'error': f'At most {MAX_BATCH_QUERIES} queries per batch'}), 400
+    
+    # Validate each query; invalid ones get a per-item error instead of failing the batch
+    results = [None] * len(queries)
+    valid = []
+    for i, query in enumerate(queries):
+        if not isinstance(query, dict) or not query.get('mood'):
+            results[i] = {'error': 'No mood provided', 'status': 400}
+            continue
+        if not isinstance(query['mood'], str) or not isinstance(query.get('language', 'All'), (str, type(None))):
+            results[i] = {'error': 'mood and language must be strings', 'status': 400}
+            continue
+        try:
+            num_songs = int(query.get('num_songs', 10))
+        except (TypeError, ValueError):
+            results[i] = {'error': 'num_songs must be an integer', 'status': 400}
+            continue
+        valid.append((i, query['mood'], query.get('language', 'All'), num_songs))
+    
+    batch = rec.recommend_batch([(mood, language, num_songs) for _, mood, language, num_songs in valid], encoded=True)
+    for (i, mood, language, _), recommendations in zip(valid, batch):
+        if recommendations is None:
+            results[i] = {'error': f'No tracks found for mood: {mood} and language: {language}', 'status': 404}
+        else:
+            results[i] = {
+                'mood': mood,
+                'language': language,
+                'count': len(recommendations),
+                'recommendations': recommendations
+            }
+    
+    return fragment_response({'count': len(results), 'results': results})
 
 @app.route('/stats')
 def stats():
     """Get dataset statistics"""
-    if not recommender:
+    rec = recommender
+    if not rec:
         return jsonify({'error': 'Recommender not initialized'}), 500
     
-    return jsonify(recommender.get_stats())
+    # Prebuilt JSON; answers 304 when the client's ETag still matches
+    response = Response(rec.stats_json, mimetype='application/json')
+    response.set_etag(rec.stats_etag)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@app.route('/health')
+def health():
+    """Service health and runtime counters"""
+    rec = recommender
+    return jsonify({
+        'status': 'ok' if rec else 'error',
+        'catalog': {
+            'version': rec.catalog_version if rec else None,
+            'loaded_at': rec.loaded_at if rec else None,
+            'load_seconds': rec.load_seconds if rec else None,
+            **catalog_reload_status
+        },
+        'sessions': conversation_history.stats(),
+        'recommend_cache': recommend_cache.stats() if recommend_cache else None,
+        'emotion': {
+            'warmup': emotion.warmup_status,
+            'detectors': emotion.cascade.stats(),
+            'stages': emotion.stage_timings.stats(),
+            'cache': emotion.cache_stats(),
+            'pool': emotion.pool_stats(),
+            'batching': emotion.batch_stats(),
+            'streams': emotion_streams.stats()
+        }
+    })
+
+@app.route('/admin/reload', methods=['POST'])
+def admin_reload():
+    """Reload the catalog in the background without restarting (requires ADMIN_TOKEN)"""
+    admin_token = os.environ.get('ADMIN_TOKEN', '').strip()
+    if not admin_token:
+        return jsonify({'error': 'Reload is disabled, set ADMIN_TOKEN to enable it'}), 403
+    # Constant-time comparison so response timing does not leak the token; WSGI header
+    # values are the raw bytes decoded as latin-1
+    supplied = request.headers.get('X-Admin-Token', '').encode('latin-1')
+    if not hmac.compare_digest(supplied, admin_token.encode('utf-8')):
+        return jsonify({'error': 'Invalid admin token'}), 401
+    if catalog_reload_status['in_progress']:
+        return jsonify({'error': 'Reload already in progress'}), 409
+    
+    threading.Thread(target=reload_catalog, name='catalog-reload', daemon=True).start()
+    return jsonify({'status': 'reloading', 'current_version': recommender.catalog_version if recommender else None}), 202
 
 @app.route('/chat', methods=['POST'])
 def chat():
     """Chat endpoint - detect mood from user message and recommend songs"""
-    if not recommender:
+    rec = recommender
+    if not rec:
         return jsonify({'error': 'Recommender not initialized'}), 500
     
     data = request.get_json()
@@ -280,14 +342,11 @@ def chat():
     if not user_message:
         return jsonify({'error': 'No message provided'}), 400
     
-    # Get or create conversation history
-    if session_id not in conversation_history:
-        conversation_history[session_id] = []
-    
-    context = conversation_history[session_id]
+    # Get conversation history (empty for new or expired sessions)
+    context = conversation_history.get(session_id)
     
     # Detect language preference from the conversation
-    detected_language_pref = recommender.detect_language_preference_from_text(user_message)
+    detected_language_pref = rec.detect_language_preference_from_text(user_message)
     
     # Determine which language to use
     language_to_use = None
@@ -313,19 +372,18 @@ def chat():
         language_source = 'default_all'
     
     # Detect mood from message with conversation context
-    detected_mood = recommender.detect_mood_from_text(user_message, context)
+    detected_mood = rec.detect_mood_from_text(user_message, context)
     
-    # Get recommendations
-    recommendations = recommender.recommend_by_mood_and_language(detected_mood, language_to_use, num_songs)
+    # Get recommendations and all track IDs for playlist creation in one lookup
+    recommendations, all_track_ids, language_used = rec.recommend_with_playlist(
+        detected_mood, language_to_use, num_songs, playlist_limit=50, encoded=True
+    )
     
-    if recommendations is None:
-        # Fallback to 'All' languages if specific language has no tracks
-        recommendations = recommender.recommend_by_mood_and_language(detected_mood, 'All', num_songs)
-        language_to_use = 'All'
+    if language_used != language_to_use:
+        # Fell back to 'All' languages because the specific language has no tracks
+        language_to_use = language_used
         language_source = 'fallback'
-    
-    # Get all track IDs for playlist creation
-    all_track_ids = recommender.get_all_tracks_for_mood_language(detected_mood, language_to_use, limit=50)
+        metrics.fallbacks.inc('language_all')
     
     # Create a friendly response with context awareness
     is_continuation = False
@@ -367,8 +425,8 @@ def chat():
     elif language_source == 'continued_from_context':
         bot_response += f' (Continuing with {language_to_use} songs)'
     
-    # Store this exchange in conversation history
-    conversation_history[session_id].append({
+    # Store this exchange in conversation history (keeps only the last 10 exchanges)
+    conversation_history.append(session_id, {
         'user_message': user_message,
         'detected_mood': detected_mood,
         'detected_language_pref': detected_language_pref,
@@ -377,11 +435,7 @@ def chat():
         'timestamp': datetime.now().isoformat()
     })
     
-    # Keep only last 10 exchanges to avoid memory issues
-    if len(conversation_history[session_id]) > 10:
-        conversation_history[session_id] = conversation_history[session_id][-10:]
-    
-    return jsonify({
+    return fragment_response({
         'user_message': user_message,
         'detected_mood': detected_mood,
         'detected_language': detected_language_pref,
@@ -394,150 +448,220 @@ def chat():
         'track_ids': all_track_ids  # For creating Spotify playlist/album link
     })
 
-@app.route('/detect-emotion', methods=['POST'])
-def detect_emotion():
-    """Detect emotion from camera image using facial expression analysis"""
+@app.route('/chat/classify-batch', methods=['POST'])
+def classify_batch():
+    """Detect mood and language for many messages without touching conversation history
+    
+    Accepts {"messages": [...]} as JSON (up to MAX_CLASSIFY_MESSAGES), or a JSONL body (one {"message": ...} object per
+    line) which is streamed back line by line with detected_mood/detected_language added.
+    """
+    rec = recommender
+    if not rec:
+        return jsonify({'error': 'Recommender not initialized'}), 500
+    
+    if request.is_json:
+        messages = (request.get_json(silent=True) or {}).get('messages')
+        if not isinstance(messages, list):
+            return jsonify({'error': 'Provide a list of messages'}), 400
+        if len(messages) > MAX_CLASSIFY_MESSAGES:
+            return jsonify({
+                'error': f'At most {MAX_CLASSIFY_MESSAGES} messages per JSON request, '
+                         'send larger jobs as JSONL (application/x-ndjson)'
+            }), 413
+        results = [rec.classify_message(str(message)) for message in messages]
+        return jsonify({'count': len(results), 'results': results})
+    
+    def generate():
+        # Reads and answers one line at a time so memory stays flat for any body size
+        for line in open_body_stream():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+                record.update(rec.classify_message(str(record.get('message', ''))))
+            except (ValueError, AttributeError) as e:
+                record = {'error': f'Invalid line: {e}'}
+            yield json.dumps(record, ensure_ascii=False) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+# Largest image accepted by /detect-emotion and /emotion-stream
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+# Largest request body: such an image base64-encoded in JSON, with room for the wrapping.
+# Werkzeug stops reading past it, so oversized bodies are refused before being buffered.
+# Routes that stream open-ended bodies read them through open_body_stream() instead.
+app.config['MAX_CONTENT_LENGTH'] = MAX_IMAGE_BYTES * 4 // 3 + 64 * 1024
+# Bodies that are the encoded image itself (no JSON, no base64)
+RAW_IMAGE_TYPES = ('image/jpeg', 'image/png', 'image/webp', 'application/octet-stream')
+
+def decode_data_url(image_data):
+    """Decode a base64 image, with or without its data URL prefix"""
+    if 'base64,' in image_data:
+        image_data = image_data.partition('base64,')[2]
+    return base64.b64decode(image_data)
+
+def open_body_stream():
+    """The request body without the MAX_CONTENT_LENGTH cap, for bodies read as they arrive"""
+    return get_input_stream(request.environ)
+
+def read_body_into(stream, length):
+    """Read a request body of known length straight into one preallocated buffer"""
+    if not hasattr(stream, 'readinto'):
+        # Under gunicorn, request.stream is gunicorn's own Body (it sets wsgi.input_terminated),
+        # which only offers read()
+        return stream.read(length)
+    buffer = bytearray(length)
+    view = memoryview(buffer)
+    filled = 0
+    while filled < length:
+        count = stream.readinto(view[filled:])
+        if not count:
+            break
+        filled += count
+    view.release()
+    del buffer[filled:]
+    return buffer
+
+def read_image_upload():
+    """Get the uploaded image from a raw, multipart or JSON (base64 data URL) request body
+    
+    Raw bodies are read from the request stream into a single buffer that OpenCV decodes
+    in place; the JSON form is kept for older clients. Raises EmotionDetectionError for
+    missing, oversized or undecodable uploads.
+    """
     try:
-        # Lazy import to avoid slow startup
-        import cv2
-        import numpy as np
-        from deepface import DeepFace
-        
-        data = request.get_json()
+        img_bytes = _read_image_body(request.mimetype)
+    except RequestEntityTooLarge:
+        raise emotion.EmotionDetectionError({'error': 'Image too large'}, status=413)
+    
+    if not img_bytes:
+        raise emotion.EmotionDetectionError({'error': 'No image provided'})
+    if len(img_bytes) > MAX_IMAGE_BYTES:
+        raise emotion.EmotionDetectionError({'error': 'Image too large'}, status=413)
+    return img_bytes
+
+def _read_image_body(mimetype):
+    """Image bytes from the request body as sent for a content type (sizes checked by the caller)"""
+    if mimetype in RAW_IMAGE_TYPES:
+        length = request.content_length
+        if length is not None and length > MAX_IMAGE_BYTES:
+            raise emotion.EmotionDetectionError({'error': 'Image too large'}, status=413)
+        if length is not None:
+            img_bytes = read_body_into(request.stream, length)
+        else:
+            # Chunked upload, size unknown up front
+            img_bytes = bytearray()
+            while len(img_bytes) <= MAX_IMAGE_BYTES:
+                chunk = request.stream.read(64 * 1024)
+                if not chunk:
+                    break
+                img_bytes += chunk
+    elif mimetype == 'multipart/form-data':
+        upload = request.files.get('image')
+        img_bytes = upload.read() if upload else None
+    else:
+        data = request.get_json(silent=True) or {}
         image_data = data.get('image')
-        
         if not image_data:
-            return jsonify({'error': 'No image provided'}), 400
-        
-        # Remove the data URL prefix
-        if 'base64,' in image_data:
-            image_data = image_data.split('base64,')[1]
-        
-        # Decode base64 image
-        img_bytes = base64.b64decode(image_data)
-        nparr = np.frombuffer(img_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if img is None:
-            return jsonify({'error': 'Invalid image data'}), 400
-        
-        # Resize to smaller frame for faster processing (max 480px width for speed)
-        height, width = img.shape[:2]
-        max_width = 480  # Smaller frame = faster processing
-        if width > max_width:
-            scale = max_width / width
-            new_width = max_width
-            new_height = int(height * scale)
-            img = cv2.resize(img, (new_width, new_height), interpolation=cv2.INTER_AREA)
-        
-        # Enhance image for better face detection
-        # Apply CLAHE (Contrast Limited Adaptive Histogram Equalization)
-        lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
-        l, a, b = cv2.split(lab)
-        clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
-        l = clahe.apply(l)
-        img = cv2.merge([l, a, b])
-        img = cv2.cvtColor(img, cv2.COLOR_LAB2BGR)
-        
-        # Increase brightness and contrast if needed
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        brightness = np.mean(gray)
-        if brightness < 120:
-            # Increase brightness for dark images
-            img = cv2.convertScaleAbs(img, alpha=1.3, beta=40)
-        
-        # Try multiple detector backends for better reliability
-        detectors = ['retinaface', 'mtcnn', 'opencv', 'ssd']
-        result = None
-        last_error = None
-        
-        for detector in detectors:
-            try:
-                print(f"Trying detector: {detector}")
-                result = DeepFace.analyze(
-                    img, 
-                    actions=['emotion'], 
-                    enforce_detection=False,  # Don't require face detection
-                    detector_backend=detector,
-                    silent=True,
-                    align=True  # Align faces for better accuracy
-                )
-                print(f"Success with {detector} detector!")
-                break  # Success, exit loop
-            except Exception as e:
-                last_error = str(e)
-                print(f"{detector} detector failed: {last_error}")
-                continue
-        
-        # If all detectors failed, return error
-        if result is None:
-            print(f"All detectors failed. Last error: {last_error}")
-            return jsonify({
-                'error': 'Could not detect face in image',
-                'details': 'Please ensure your face is clearly visible, well-lit, and facing the camera directly.',
-                'debug': last_error
-            }), 400
-        
-        # Handle both single result and list of results
-        if isinstance(result, list):
-            if len(result) == 0:
-                return jsonify({
-                    'error': 'No face detected in image',
-                    'details': 'Please ensure your face is clearly visible and try again.'
-                }), 400
-            result = result[0]
-        
-        emotions = result.get('emotion', {})
-        dominant_emotion = result.get('dominant_emotion', 'neutral')
-        
-        # Convert all NumPy types to Python native types (fix JSON serialization)
-        emotions_clean = {}
-        for key, value in emotions.items():
-            # Convert numpy.float32/float64 to Python float
-            if hasattr(value, 'item'):
-                emotions_clean[key] = float(value.item())
-            else:
-                emotions_clean[key] = float(value)
-        
-        # Map DeepFace emotions to our mood categories
-        emotion_to_mood = {
-            'happy': 'Happy',
-            'sad': 'Sad',
-            'angry': 'Energetic',
-            'surprise': 'Happy',  # Changed from Excited to Happy
-            'fear': 'Calm',
-            'disgust': 'Focus',
-            'neutral': 'Calm'
-        }
-        
-        # Get the detected mood
-        detected_mood = emotion_to_mood.get(dominant_emotion.lower(), 'Happy')
-        
-        # Get confidence score and convert to Python float
-        confidence = emotions_clean.get(dominant_emotion, 0.0)
-        
-        # Apply confidence threshold for stability (only accept if confidence > 30%)
-        if confidence < 30.0:
-            # If confidence is low, use neutral/calm mood
-            detected_mood = 'Calm'
-            dominant_emotion = 'neutral'
-        
-        # IMAGE IS AUTOMATICALLY DELETED - Python variables are garbage collected
-        # No need to manually delete, img and result will be cleared from memory
-        
-        return jsonify({
-            'success': True,
-            'detected_mood': str(detected_mood),  # Ensure string type
-            'dominant_emotion': str(dominant_emotion),  # Ensure string type
-            'confidence': round(float(confidence), 2),
-            'all_emotions': {k: round(float(v), 2) for k, v in emotions_clean.items()},
-            'message': f"Detected {dominant_emotion} expression! Suggesting {detected_mood} music."
-        })
+            raise emotion.EmotionDetectionError({'error': 'No image provided'})
+        try:
+            img_bytes = decode_data_url(image_data)
+        except ValueError:
+            raise emotion.EmotionDetectionError({'error': 'Invalid image data'})
+    return img_bytes
+
+def request_session_id():
+    """Session id sent with an upload (query string, X-Session-Id header, form or JSON field)"""
+    session_id = request.args.get('session_id') or request.headers.get('X-Session-Id')
+    if not session_id and request.mimetype == 'multipart/form-data':
+        session_id = request.form.get('session_id')
+    if not session_id and request.is_json:
+        session_id = (request.get_json(silent=True) or {}).get('session_id')
+    return session_id or None
+
+@app.route('/detect-emotion', methods=['POST'])
+def detect_emotion():
+    """Detect emotion from camera image using facial expression analysis
     
+    The image can be sent as a raw body (image/jpeg, image/png, application/octet-stream),
+    as the "image" field of a multipart form, or as a base64 data URL in JSON ({"image": ...}).
+    With a session_id, near-identical repeat frames are answered from the session's cache.
+    """
+    try:
+        img_bytes = read_image_upload()
+        return jsonify(emotion.detect_emotion(img_bytes, request_session_id()))
+    
+    except emotion.EmotionDetectionError as e:
+        return jsonify(e.payload), e.status, e.headers
     except Exception as e:
         print(f"Error in emotion detection: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/emotion-stream/<session_id>/frames', methods=['POST'])
+def emotion_stream_frames(session_id):
+    """Push camera frames for a session; only the newest unprocessed one is kept
+    
+    Accepts one frame in any /detect-emotion format (JSON, image/*, multipart), or a
+    long-lived (chunked) application/octet-stream body of frames, each prefixed by its
+    4-byte big-endian length.
+    """
+    stream = emotion_streams.get(session_id)
+    if stream is None:
+        return jsonify({'error': 'Too many active emotion streams'}), 503, {'Retry-After': '5'}
+    
+    accepted = 0
+    if request.mimetype == 'application/octet-stream':
+        if not emotion_streams.open_connection():
+            return jsonify({'error': 'Too many open emotion stream connections'}), 503, {'Retry-After': '5'}
+        try:
+            for frame in read_frames(open_body_stream(), EMOTION_STREAM_MAX_FRAME_BYTES):
+                stream.push(frame)
+                accepted += 1
+        except FrameStreamError as e:
+            return jsonify({'error': str(e), 'accepted': accepted}), 400
+        finally:
+            emotion_streams.close_connection()
+    else:
+        try:
+            stream.push(read_image_upload())
+        except emotion.EmotionDetectionError as e:
+            return jsonify(e.payload), e.status
+        accepted = 1
+    
+    return jsonify({'accepted': accepted, **stream.stats()})
+
+@app.route('/emotion-stream/<session_id>/events')
+def emotion_stream_events(session_id):
+    """Server-sent smoothed mood for a session, at most one event per tick"""
+    stream = emotion_streams.get(session_id)
+    if stream is None:
+        return jsonify({'error': 'Too many active emotion streams'}), 503, {'Retry-After': '5'}
+    if not emotion_streams.open_connection():
+        return jsonify({'error': 'Too many open emotion stream connections'}), 503, {'Retry-After': '5'}
+    response = Response(stream.events(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # The server closes the response when the client goes away (noticed at the next write)
+    response.call_on_close(emotion_streams.close_connection)
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics: route and stage latency histograms, fallback and error counters"""
+    if not metrics.ENABLED:
+        return jsonify({'error': 'Metrics are disabled, set METRICS_ENABLED=1 to enable them'}), 404
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/ready')
+def ready():
+    """Readiness: catalog loaded and emotion models resident (unless warmup is off)"""
+    is_ready = recommender is not None and (emotion.is_ready() or EMOTION_WARMUP == 'off')
+    return jsonify({
+        'ready': is_ready,
+        'catalog': recommender is not None,
+        'emotion': emotion.warmup_status
+    }), 200 if is_ready else 503
+
 if __name__ == '__main__':
     print("\n" + "="*60)
     print("🎵 Spotify Mood-Based Music Recommendation System")
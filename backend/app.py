@@ -1,14 +1,19 @@
 from flask import Flask, render_template, request, jsonify
 from flask_cors import CORS
-import pandas as pd
 import os
+import sys
 from datetime import datetime
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
 
 # Data path (assumes dataset is included in repo under data/)
-DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'spotify_mood_tracks_multilang.csv')
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_PATH = os.path.join(ROOT_DIR, 'data', 'spotify_mood_tracks_multilang.csv')
+
+# Shared catalog loader lives in the repo root next to data/
+sys.path.insert(0, ROOT_DIR)
+from catalog import load_catalog  # noqa: E402
 
 
 class MoodBasedRecommender:
@@ -43,7 +48,7 @@ class MoodBasedRecommender:
 
 # Initialize recommender
 try:
-    tracks_df = pd.read_csv(DATA_PATH)
+    tracks_df = load_catalog(DATA_PATH)
     recommender = MoodBasedRecommender(tracks_df)
     print('✓ Dataset loaded successfully (backend)')
 except Exception as e:
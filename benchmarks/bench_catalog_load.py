@@ -0,0 +1,82 @@
+"""Benchmark: catalog startup time and resident memory, CSV vs compiled binary catalog
+
+Each measurement runs in a fresh process so import caches and the allocator don't
+carry over. Usage: python benchmarks/bench_catalog_load.py [--scales 1 100]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+DATA_PATH = os.path.join(ROOT_DIR, 'data', 'spotify_mood_tracks_multilang.csv')
+
+# Runs in the child process: load the catalog and report time and memory
+CHILD = r"""
+import json, sys, time
+sys.path.insert(0, {root!r})
+import pandas as pd, numpy as np
+import catalog
+
+def rss_kb(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field):
+                return int(line.split()[1])
+
+before = rss_kb('VmRSS:')
+start = time.perf_counter()
+if {fmt!r} == 'csv':
+    df = pd.read_csv({path!r})
+else:
+    df = catalog.read_catalog(catalog.catalog_path_for({path!r}))
+elapsed = time.perf_counter() - start
+print(json.dumps({{'rows': len(df), 'load_s': elapsed,
+                  'rss_mb': (rss_kb('VmRSS:') - before) / 1024, 'peak_mb': (rss_kb('VmHWM:') - before) / 1024}}))
+"""
+
+
+def scaled_csv(scale, out_dir):
+    """Write the shipped catalog repeated `scale` times (with unique track ids) into out_dir"""
+    import pandas as pd
+    base = pd.read_csv(DATA_PATH)
+    parts = []
+    for i in range(scale):
+        part = base.copy()
+        part['id'] = part['id'] + f'-{i}'
+        parts.append(part)
+    path = os.path.join(out_dir, f'tracks_x{scale}.csv')
+    pd.concat(parts, ignore_index=True).to_csv(path, index=False)
+    return path
+
+
+def measure(fmt, path):
+    code = CHILD.format(root=ROOT_DIR, fmt=fmt, path=path)
+    output = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 100])
+    args = parser.parse_args()
+
+    import catalog
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'scale':>6} {'rows':>9} {'format':>7} {'load ms':>9} {'RSS MB':>8} {'peak MB':>8}")
+        for scale in args.scales:
+            path = scaled_csv(scale, tmp)
+            catalog.compile_catalog(path)
+            for fmt in ('csv', 'binary'):
+                result = measure(fmt, path)
+                print(f"{scale:>6} {result['rows']:>9} {fmt:>7} {result['load_s'] * 1000:>9.1f} "
+                      f"{result['rss_mb']:>8.1f} {result['peak_mb']:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Benchmark: throughput and latency of the emotion model with and without micro-batching
+
+Closed-loop clients (threads) each classify one face crop at a time, either calling the
+model directly (batch 1) or through emotion.MicroBatcher with the given batch size and
+wait window. Only the classification stage is measured; face detection runs per frame
+either way. Needs DeepFace and TensorFlow; runs on CPU unless a GPU is visible.
+
+Usage: python benchmarks/bench_emotion_batching.py [--clients 16] [--seconds 5]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import emotion  # noqa: E402
+
+
+def run(clients, seconds, batch_max, wait_ms):
+    """Latencies (ms) of every request completed by `clients` threads in `seconds`"""
+    batcher = emotion.MicroBatcher(emotion.classify_faces, batch_max, wait_ms) if batch_max > 1 else None
+    face = np.random.default_rng(0).random((224, 224, 3), dtype=np.float32)
+    latencies = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def client():
+        local = []
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            if batcher is not None:
+                batcher.submit(face).result()
+            else:
+                emotion.classify_faces([face])
+            local.append((time.perf_counter() - start) * 1000)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return np.array(latencies), batcher
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--batch-sizes', default='1,4,8,16')
+    parser.add_argument('--waits', default='5,10,20', help='Batching windows in ms')
+    args = parser.parse_args()
+
+    emotion.warmup()
+    # Trace every batch shape up front so graph building doesn't count against a run
+    face = np.zeros((224, 224, 3), dtype=np.float32)
+    for size in range(1, max(int(b) for b in args.batch_sizes.split(',')) + 1):
+        emotion.classify_faces([face] * size)
+
+    print(f"{args.clients} clients, {args.seconds:.0f}s per run")
+    print(f"{'batch':>5} {'wait ms':>7} {'faces/s':>8} {'p50 ms':>7} {'p99 ms':>7} {'avg batch':>9}")
+    for batch_max in (int(b) for b in args.batch_sizes.split(',')):
+        for wait_ms in ([0] if batch_max == 1 else [float(w) for w in args.waits.split(',')]):
+            latencies, batcher = run(args.clients, args.seconds, batch_max, wait_ms)
+            avg_batch = batcher.stats()['avg_batch'] if batcher else 1
+            print(f"{batch_max:>5} {wait_ms:>7.0f} {len(latencies) / args.seconds:>8.0f} "
+                  f"{np.percentile(latencies, 50):>7.1f} {np.percentile(latencies, 99):>7.1f} {avg_batch:>9}")
+
+
+if __name__ == '__main__':
+    main()
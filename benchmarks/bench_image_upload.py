@@ -0,0 +1,58 @@
+"""Microbenchmark: /detect-emotion upload handling, JSON + base64 data URL vs raw JPEG body
+
+Measures bytes on the wire and the server-side time from request body to decoded BGR image
+(body parsing alone, then with cv2.imdecode), without running emotion inference.
+
+Usage: python benchmarks/bench_image_upload.py [--repeat 500]
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import timeit
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+import emotion  # noqa: E402
+
+
+def camera_frame(width, height):
+    """A JPEG (quality 70, like the chat page) with enough texture to compress realistically"""
+    rng = np.random.default_rng(0)
+    img = cv2.GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (9, 9), 0)
+    return cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 70])[1].tobytes()
+
+
+def time_upload(body, content_type, repeat, decode):
+    def handle():
+        with app.app.test_request_context('/detect-emotion', method='POST', data=body,
+                                          content_type=content_type):
+            img_bytes = app.read_image_upload()
+            if decode:
+                emotion.decode_image(img_bytes)
+    return timeit.timeit(handle, number=repeat) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=500)
+    args = parser.parse_args()
+
+    print(f"{'frame':>10} {'path':>6} {'bytes':>9} {'body us':>8} {'+decode us':>11}")
+    for width, height in ((480, 360), (1280, 720)):
+        jpeg = camera_frame(width, height)
+        data_url = json.dumps({'image': 'data:image/jpeg;base64,' + base64.b64encode(jpeg).decode('ascii')})
+        for path, body, content_type in (('json', data_url.encode('utf-8'), 'application/json'),
+                                          ('raw', jpeg, 'image/jpeg')):
+            body_us = time_upload(body, content_type, args.repeat, decode=False)
+            total_us = time_upload(body, content_type, args.repeat, decode=True)
+            print(f"{f'{width}x{height}':>10} {path:>6} {len(body):>9} {body_us:>8.0f} {total_us:>11.0f}")
+
+
+if __name__ == '__main__':
+    main()
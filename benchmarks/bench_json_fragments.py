@@ -0,0 +1,63 @@
+"""Microbenchmark: /recommend and /chat response serialization, DataFrame records vs JSON fragments
+
+The old path sliced the catalog with iloc, converted the rows with to_dict('records') and
+let jsonify encode every field again on each request. The new path joins each track's
+pre-encoded JSON object. Both produce the same bytes; only the serialization step
+(ranked positions -> response body) is timed, not mood matching or routing.
+
+Usage: python benchmarks/bench_json_fragments.py [--repeat 2000]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+
+def legacy_body(rec, mood, n, payload):
+    """The previous recommendations list + jsonify()"""
+    positions = rec._get_ranked_positions(mood, None)[:n]
+    payload['recommendations'] = rec._track_records.iloc[positions].to_dict('records')
+    return app.jsonify(payload).get_data()
+
+
+def fragment_body(rec, mood, n, payload):
+    payload['recommendations'] = rec._ranked_json((mood, None), n)
+    return app.fragment_response(payload).get_data()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    rec = app.recommender
+    mood = next(iter(rec._ranked_positions))[0]
+    positions = rec._get_ranked_positions(mood, None)
+    shapes = {
+        # /recommend: three small fields around the list
+        'recommend': {'mood': mood, 'language': 'All', 'count': 0},
+        # /chat: message, mood fields, playlist ids and a few more keys
+        'chat': {'user_message': 'I am so happy today', 'detected_mood': mood, 'language': 'All',
+                 'language_fallback': False, 'bot_response': 'Here are some songs for you!',
+                 'spotify_playlist_url': None, 'track_ids': [str(i) for i in rec._track_ids[positions[:50]]],
+                 'session_id': 'a' * 32, 'timestamp': '2026-01-01T00:00:00'}
+    }
+
+    print(f"{len(rec.tracks_df)} tracks, mood {mood!r}")
+    print(f"{'route':>10} {'n':>4} {'old us':>8} {'new us':>8} {'saved us':>9} {'speedup':>8}")
+    with app.app.app_context():
+        for route, payload in shapes.items():
+            for n in (5, 10, 25, 50):
+                assert legacy_body(rec, mood, n, dict(payload)) == fragment_body(rec, mood, n, dict(payload))
+                old = timeit.timeit(lambda: legacy_body(rec, mood, n, dict(payload)), number=args.repeat)
+                new = timeit.timeit(lambda: fragment_body(rec, mood, n, dict(payload)), number=args.repeat)
+                old, new = old / args.repeat * 1e6, new / args.repeat * 1e6
+                print(f"{route:>10} {n:>4} {old:>8.0f} {new:>8.0f} {old - new:>9.0f} {old / new:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Microbenchmark: compiled mood keyword matcher vs the old per-keyword substring loop
+
+Usage: python benchmarks/bench_mood_matcher.py [--repeat 2000]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import DEFAULT_CSV_PATH  # noqa: E402
+from mood_recommender import build_recommender  # noqa: E402
+
+
+def legacy_mood_scores(recommender, text):
+    """The previous implementation: one substring scan per keyword"""
+    text_lower = text.lower()
+    mood_scores = {}
+    for mood, keywords in recommender.mood_keywords.items():
+        score = 0
+        for keyword in keywords:
+            if keyword in text_lower:
+                score += 1
+        mood_scores[mood] = score
+    return mood_scores
+
+
+SENTENCES = [
+    "I had such a long day at the office and the deadline for the project is tomorrow",
+    "honestly I just want to relax and sleep but my friends want a crazy night out",
+    "feeling a bit lonely since the breakup, missing her a lot",
+    "need some motivation to hit the gym and go beast mode, never give up",
+    "yaar aaj bahut khush hoon, party karte hain",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    recommender = build_recommender(os.environ.get('CATALOG_PATH', DEFAULT_CSV_PATH))
+
+    print(f"{'message length':>15} {'legacy us':>10} {'compiled us':>12} {'speedup':>8}")
+    for copies in (1, 5, 20, 100):
+        text = ' '.join(SENTENCES * copies)
+        legacy = timeit.timeit(lambda: legacy_mood_scores(recommender, text), number=args.repeat)
+        compiled = timeit.timeit(lambda: recommender.count_mood_keywords(text), number=args.repeat)
+        legacy_us = legacy / args.repeat * 1e6
+        compiled_us = compiled / args.repeat * 1e6
+        print(f"{len(text):>15} {legacy_us:>10.1f} {compiled_us:>12.1f} {legacy_us / compiled_us:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""Benchmark: per-worker memory under gunicorn, preloaded copy-on-write catalog vs a copy per worker
+
+Starts gunicorn -c gunicorn.conf.py on a synthetic catalog with 1, 4 and 16 workers, with
+the app preloaded in the master (GUNICORN_PRELOAD=1) and loaded by every worker
+(GUNICORN_PRELOAD=0). Traffic to /recommend and /chat is sent first so the workers reach
+steady state. Then every worker's RSS, PSS (shared pages split between the processes that
+map them) and USS (pages only it holds) are read from /proc/<pid>/smaps_rollup. Total PSS
+over master and workers is what the deployment really costs. Emotion inference is off
+(EMOTION_WORKERS=0, EMOTION_WARMUP=off) so only the web workers are counted. Linux only.
+
+Usage: python benchmarks/bench_prefork_memory.py [--rows 100000] [--workers 1 4 16] [-o results.json]
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import synthetic_catalog  # noqa: E402
+
+
+def smaps_mb(pid):
+    """RSS, PSS and USS of a process in MB"""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+                values[parts[0][:-1]] = int(parts[1]) / 1024
+    return {
+        'rss_mb': round(values['Rss'], 1),
+        'pss_mb': round(values['Pss'], 1),
+        'uss_mb': round(values.get('Private_Clean', 0) + values.get('Private_Dirty', 0), 1)
+    }
+
+
+def children(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(child) for child in f.read().split()]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def request(port, method, path, body=None):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    try:
+        connection.request(method, path, body=json.dumps(body) if body else None,
+                           headers={'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    finally:
+        connection.close()
+
+
+def drive_traffic(port, count, seed=0):
+    """Mixed /recommend and /chat requests, new connection each so they spread over workers"""
+    rng = random.Random(seed)
+    moods = list(synthetic_catalog.MOODS)
+    languages = list(synthetic_catalog.LANGUAGES) + ['All']
+    for i in range(count):
+        if i % 2:
+            request(port, 'POST', '/recommend', {'mood': rng.choice(moods), 'language': rng.choice(languages),
+                                                 'num_songs': rng.choice([5, 10, 50, 200])})
+        else:
+            request(port, 'POST', '/chat', {'message': f'{rng.choice(moods)} {rng.choice(languages)} songs',
+                                            'session_id': f'bench-{i % 100}', 'num_songs': 10})
+
+
+def measure(catalog_path, workers, preload, requests_per_worker, timeout=600):
+    port = free_port()
+    env = dict(os.environ, CATALOG_PATH=catalog_path, PORT=str(port), WEB_CONCURRENCY=str(workers),
+               GUNICORN_PRELOAD='1' if preload else '0', EMOTION_WORKERS='0', EMOTION_WARMUP='off',
+               PRELOAD_APP='0', PYTHONUNBUFFERED='1')
+    # The app prints this once per load: in the master when preloaded, else in every worker
+    loads_expected = 1 if preload else workers
+    log = tempfile.TemporaryFile(mode='w+')
+    start = time.perf_counter()
+    master = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+                              cwd=ROOT_DIR, env=env, stdout=log, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            if master.poll() is not None:
+                raise RuntimeError(f"gunicorn exited with code {master.returncode}")
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"gunicorn did not start within {timeout}s")
+            log.seek(0)
+            if log.read().count('Dataset loaded successfully') >= loads_expected \
+                    and len(children(master.pid)) == workers:
+                try:
+                    if request(port, 'GET', '/health') == 200:
+                        break
+                except OSError:
+                    pass
+            time.sleep(0.2)
+        startup_s = time.perf_counter() - start
+
+        drive_traffic(port, requests_per_worker * workers)
+        worker_stats = [smaps_mb(pid) for pid in children(master.pid)]
+        master_stats = smaps_mb(master.pid)
+    finally:
+        master.send_signal(signal.SIGTERM)
+        master.wait()
+        log.close()
+
+    def mean(key):
+        return round(sum(w[key] for w in worker_stats) / len(worker_stats), 1)
+
+    return {
+        'workers': workers,
+        'preload': preload,
+        'startup_s': round(startup_s, 2),
+        'master': master_stats,
+        'worker_rss_mb': mean('rss_mb'),
+        'worker_pss_mb': mean('pss_mb'),
+        'worker_uss_mb': mean('uss_mb'),
+        'total_pss_mb': round(master_stats['pss_mb'] + sum(w['pss_mb'] for w in worker_stats), 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--requests-per-worker', type=int, default=100)
+    parser.add_argument('--catalog-dir', default=os.path.join(ROOT_DIR, 'data', 'synthetic'))
+    parser.add_argument('-o', '--output', help='Also write the results as JSON')
+    args = parser.parse_args()
+
+    catalog_path = synthetic_catalog.write_catalog(args.rows, args.catalog_dir, compile_binary=True)
+    print(f"{args.rows} tracks")
+    print(f"{'workers':>7} {'preload':>7} {'start s':>7} {'RSS/worker':>10} {'PSS/worker':>10} "
+          f"{'USS/worker':>10} {'total PSS':>9}")
+    results = []
+    for workers in args.workers:
+        for preload in (False, True):
+            result = measure(catalog_path, workers, preload, args.requests_per_worker)
+            results.append(result)
+            print(f"{workers:>7} {'yes' if preload else 'no':>7} {result['startup_s']:>7.1f} "
+                  f"{result['worker_rss_mb']:>10.1f} {result['worker_pss_mb']:>10.1f} "
+                  f"{result['worker_uss_mb']:>10.1f} {result['total_pss_mb']:>9.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'rows': args.rows, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
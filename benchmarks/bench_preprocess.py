@@ -0,0 +1,64 @@
+"""Microbenchmark: emotion frame decode + preprocessing, reduced decode and fused steps vs the old path
+
+The old path decoded at full resolution, resized to 480px, then ran LAB -> split -> CLAHE ->
+merge -> BGR and a separate grayscale conversion for the brightness check.
+
+Usage: python benchmarks/bench_preprocess.py [--repeat 50]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import emotion  # noqa: E402
+
+
+def legacy_pipeline(img_bytes):
+    """The previous decode_image() + preprocess()"""
+    img = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_COLOR)
+    height, width = img.shape[:2]
+    if width > 480:
+        img = cv2.resize(img, (480, int(height * 480 / width)), interpolation=cv2.INTER_AREA)
+    lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
+    l, a, b = cv2.split(lab)
+    l = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8)).apply(l)
+    img = cv2.cvtColor(cv2.merge([l, a, b]), cv2.COLOR_LAB2BGR)
+    if np.mean(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)) < 120:
+        img = cv2.convertScaleAbs(img, alpha=1.3, beta=40)
+    return img
+
+
+def camera_frame(width, height, brightness):
+    """A smooth synthetic JPEG (quality 85) at the given mean brightness"""
+    rng = np.random.default_rng(0)
+    img = cv2.GaussianBlur(rng.integers(0, 255, (height // 8, width // 8, 3), dtype=np.uint8), (5, 5), 0)
+    img = cv2.resize(img, (width, height), interpolation=cv2.INTER_CUBIC)
+    img = cv2.convertScaleAbs(img, alpha=0.6, beta=brightness - 0.6 * img.mean())
+    return cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'source':>10} {'old ms':>7} {'new ms':>7} {'decode':>7} {'preproc':>8} {'speedup':>8} {'mean diff':>10}")
+    for width, height in ((640, 480), (1280, 720), (1920, 1080), (4032, 3024)):
+        jpeg = camera_frame(width, height, brightness=100)
+        old = timeit.timeit(lambda: legacy_pipeline(jpeg), number=args.repeat) / args.repeat * 1000
+        decode = timeit.timeit(lambda: emotion.decode_image(jpeg), number=args.repeat) / args.repeat * 1000
+        decoded = emotion.decode_image(jpeg)
+        preproc = timeit.timeit(lambda: emotion.preprocess(decoded.copy()), number=args.repeat) / args.repeat * 1000
+        new = decode + preproc
+        diff = np.abs(legacy_pipeline(jpeg).astype(np.int16) - emotion.preprocess(decoded).astype(np.int16)).mean()
+        print(f"{f'{width}x{height}':>10} {old:>7.2f} {new:>7.2f} {decode:>7.2f} {preproc:>8.2f} "
+              f"{old / new:>7.1f}x {diff:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,367 @@
+"""Benchmark suite: recommender microbenchmarks and HTTP load tests on synthetic catalogs
+
+For each catalog size a synthetic catalog is generated (see synthetic_catalog.py) and
+compiled, then:
+  micro  a fresh process loads it and times the recommender methods and text detectors
+  load   a fresh server process serves it and closed-loop clients drive /recommend,
+         /chat, /stats and /detect-emotion, reporting throughput and p50/p95/p99 of
+         answered requests (rejections are counted by status)
+/detect-emotion runs against the stub DeepFace in benchmarks/stub_deepface, so it needs
+no GPU, TensorFlow or model downloads (--real-deepface uses the installed one instead).
+Everything is written to one JSON file; --compare prints the change against an earlier one.
+
+Usage: python benchmarks/run_suite.py [--rows 1000 100000 1000000] [--duration 10]
+           [--clients 8] [-o results.json] [--compare previous.json]
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import timeit
+from datetime import datetime, timezone
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+STUB_DIR = os.path.join(BENCH_DIR, 'stub_deepface')
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import synthetic_catalog  # noqa: E402
+
+SCENARIOS = ('recommend', 'chat', 'stats', 'detect-emotion')
+
+MESSAGES = [
+    'I am so happy today',
+    'feeling a bit lonely since the breakup, missing her a lot',
+    'need some motivation to hit the gym and go beast mode',
+    'play some hindi party songs for tonight',
+    'honestly I just want to relax and sleep',
+    'exam tomorrow, need to focus',
+    'more please',
+    'tamil love songs',
+]
+MOODS = list(synthetic_catalog.MOODS)
+LANGUAGES = list(synthetic_catalog.LANGUAGES) + ['All']
+
+
+def rss_mb(field='VmRSS:'):
+    """Resident (or peak, with VmHWM:) memory of this process in MB, None off Linux"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+
+
+def time_call(func, repeat=5):
+    """Per-call microseconds (min and median over repeat runs of an auto-sized loop)"""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    runs = [t / number * 1e6 for t in timer.repeat(repeat=repeat, number=number)]
+    return {'min_us': round(min(runs), 3), 'median_us': round(float(np.median(runs)), 3), 'calls': number}
+
+
+def micro_benchmarks():
+    """Runs in the child process with CATALOG_PATH set; returns the microbenchmark results"""
+    start = time.perf_counter()
+    import app
+    import_seconds = time.perf_counter() - start
+    rec = app.recommender
+    if rec is None:
+        raise RuntimeError(f"Catalog failed to load from {app.DATA_PATH}")
+
+    context = [{'detected_mood': 'Happy', 'language_used': 'Hindi'}]
+    queries = [(MOODS[i % len(MOODS)], LANGUAGES[i % len(LANGUAGES)], 10) for i in range(10)]
+
+    cases = {
+        'recommend_by_mood_and_language': lambda: rec.recommend_by_mood_and_language('Happy', 'Hindi', 10),
+        'recommend_json': lambda: rec.recommend_json('Happy', 'Hindi', 10),
+        # As /chat and /recommend/batch call them
+        'recommend_with_playlist': lambda: rec.recommend_with_playlist('Sad', 'Tamil', 10, playlist_limit=50,
+                                                                       encoded=True),
+        'recommend_batch_10': lambda: rec.recommend_batch(queries, encoded=True),
+        'get_stats': rec.get_stats,
+    }
+    results = {name: time_call(func) for name, func in cases.items()}
+    # Text detectors vary with the message, so time the whole set and report per message
+    for name, func in (('detect_mood_from_text', lambda m: rec.detect_mood_from_text(m, context)),
+                       ('detect_language_preference_from_text', rec.detect_language_preference_from_text)):
+        result = time_call(lambda: [func(m) for m in MESSAGES])
+        results[name] = {k: round(v / len(MESSAGES), 3) if k.endswith('_us') else v for k, v in result.items()}
+
+    return {
+        'rows': len(rec.tracks_df),
+        'import_s': round(import_seconds, 3),
+        'load_s': rec.load_seconds,
+        'rss_mb': rss_mb(),
+        'peak_rss_mb': rss_mb('VmHWM:'),
+        'methods': results
+    }
+
+
+def serve(port):
+    """Runs in the child process: serve the app on 127.0.0.1:port with keep-alive"""
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    import app
+
+    WSGIRequestHandler.protocol_version = 'HTTP/1.1'
+    print(json.dumps({'rss_mb': rss_mb()}), flush=True)
+    make_server('127.0.0.1', port, app.app, threaded=True).serve_forever()
+
+
+def child_env(catalog_path, real_deepface=False):
+    env = dict(os.environ, CATALOG_PATH=catalog_path, PYTHONUNBUFFERED='1')
+    env.setdefault('EMOTION_WARMUP', 'eager')
+    if not real_deepface:
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [STUB_DIR, ROOT_DIR, env.get('PYTHONPATH')]))
+    return env
+
+
+def run_child(mode, catalog_path, real_deepface=False):
+    output = subprocess.run([sys.executable, __file__, '--child', mode], cwd=ROOT_DIR, check=True,
+                            capture_output=True, text=True, env=child_env(catalog_path, real_deepface)).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(catalog_path, real_deepface=False, timeout=600):
+    """Start a server process for the catalog; returns (process, port) once it answers"""
+    port = free_port()
+    process = subprocess.Popen([sys.executable, __file__, '--child', 'serve', '--port', str(port)],
+                               cwd=ROOT_DIR, env=child_env(catalog_path, real_deepface),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', '/health')
+            if connection.getresponse().status == 200:
+                connection.close()
+                return process, port
+        except OSError:
+            pass
+        time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"Server did not start within {timeout}s")
+
+
+def test_frames(count=4):
+    """A few distinct 640x480 JPEGs, as the chat page's camera capture sends them"""
+    import cv2
+
+    rng = np.random.default_rng(0)
+    frames = []
+    for _ in range(count):
+        img = cv2.GaussianBlur(rng.integers(0, 255, (480, 640, 3), dtype=np.uint8), (9, 9), 0)
+        frames.append(cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 70])[1].tobytes())
+    return frames
+
+
+def make_request(scenario, rng, frames):
+    """(method, path, body, headers) for one request of a scenario"""
+    if scenario == 'recommend':
+        body = {'mood': rng.choice(MOODS), 'language': rng.choice(LANGUAGES), 'num_songs': rng.choice([5, 10, 20])}
+    elif scenario == 'chat':
+        body = {'message': rng.choice(MESSAGES), 'session_id': f'bench-{rng.randrange(50)}', 'num_songs': 5}
+    elif scenario == 'stats':
+        return 'GET', '/stats', None, {}
+    else:
+        return 'POST', '/detect-emotion', rng.choice(frames), {'Content-Type': 'image/jpeg'}
+    return 'POST', f'/{scenario}', json.dumps(body), {'Content-Type': 'application/json'}
+
+
+def load_test(port, scenario, clients, duration, warmup, frames, seed=0):
+    """Closed loop: each client sends its next request as soon as the last one answers"""
+    latencies = []
+    statuses = {}
+    errors = [0]
+    lock = threading.Lock()
+    start_at = time.perf_counter() + warmup
+    stop_at = start_at + duration
+
+    def client(index):
+        rng = random.Random(seed * 1000 + index)
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        local, local_statuses, local_errors = [], {}, 0
+        while True:
+            now = time.perf_counter()
+            if now >= stop_at:
+                break
+            method, path, body, headers = make_request(scenario, rng, frames)
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+                local_errors += now >= start_at
+                continue
+            if now >= start_at:
+                if response.status < 400:
+                    local.append((time.perf_counter() - now) * 1000)
+                local_statuses[response.status] = local_statuses.get(response.status, 0) + 1
+        connection.close()
+        with lock:
+            latencies.extend(local)
+            for status, count in local_statuses.items():
+                statuses[str(status)] = statuses.get(str(status), 0) + count
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Throughput and latency count answered requests; rejections (e.g. 503 when the
+    # emotion queue is full) only show up in statuses
+    ok = len(latencies)
+    latencies = np.array(latencies) if latencies else np.zeros(1)
+    return {
+        'clients': clients,
+        'duration_s': duration,
+        'requests': int(sum(statuses.values())),
+        'ok_requests': ok,
+        'throughput_rps': round(ok / duration, 1),
+        'mean_ms': round(float(latencies.mean()), 3),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+        'p95_ms': round(float(np.percentile(latencies, 95)), 3),
+        'p99_ms': round(float(np.percentile(latencies, 99)), 3),
+        'max_ms': round(float(latencies.max()), 3),
+        'statuses': statuses,
+        'errors': errors[0]
+    }
+
+
+def run_metadata(args):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'args': {k: v for k, v in vars(args).items() if k not in ('child', 'port', 'compare')}
+    }
+
+
+def compare(previous_path, current):
+    """Print per-benchmark change from an earlier results file"""
+    with open(previous_path) as f:
+        previous = json.load(f)
+    before = {c['rows']: c for c in previous['catalogs']}
+    print(f"\nCompared with {previous_path} ({previous['meta'].get('git_commit')})")
+    print(f"{'rows':>9} {'benchmark':>38} {'before':>10} {'after':>10} {'change':>8}")
+    for entry in current['catalogs']:
+        old = before.get(entry['rows'])
+        if old is None:
+            continue
+        rows = []
+        for name, result in entry.get('micro', {}).get('methods', {}).items():
+            if name in old.get('micro', {}).get('methods', {}):
+                rows.append((f'{name} us', old['micro']['methods'][name]['min_us'], result['min_us']))
+        for scenario, result in entry.get('load', {}).items():
+            if scenario in old.get('load', {}):
+                rows.append((f'{scenario} rps', old['load'][scenario]['throughput_rps'], result['throughput_rps']))
+                rows.append((f'{scenario} p99 ms', old['load'][scenario]['p99_ms'], result['p99_ms']))
+        for name, old_value, new_value in rows:
+            change = f'{(new_value - old_value) / old_value * 100:+.1f}%' if old_value else 'n/a'
+            print(f"{entry['rows']:>9} {name:>38} {old_value:>10} {new_value:>10} {change:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 100000, 1000000],
+                        help='Catalog sizes (up to 10000000)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--catalog-dir', default=os.path.join(ROOT_DIR, 'data', 'synthetic'),
+                        help='Where generated catalogs are kept and reused')
+    parser.add_argument('--scenarios', nargs='+', default=list(SCENARIOS), choices=SCENARIOS)
+    parser.add_argument('--skip-micro', action='store_true')
+    parser.add_argument('--skip-load', action='store_true')
+    parser.add_argument('--duration', type=float, default=10, help='Measured seconds per load scenario')
+    parser.add_argument('--warmup', type=float, default=2, help='Unmeasured seconds before each scenario')
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--real-deepface', action='store_true', help='Use the installed DeepFace, not the stub')
+    parser.add_argument('-o', '--output', help='Results file (default: benchmarks/results/<time>.json)')
+    parser.add_argument('--compare', help='Earlier results file to compare against')
+    parser.add_argument('--child', choices=['micro', 'serve'], help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child == 'micro':
+        print(json.dumps(micro_benchmarks()))
+        return
+    if args.child == 'serve':
+        serve(args.port)
+        return
+
+    results = {'meta': run_metadata(args), 'catalogs': []}
+    frames = test_frames() if 'detect-emotion' in args.scenarios else None
+    for rows in args.rows:
+        start = time.perf_counter()
+        path = synthetic_catalog.write_catalog(rows, args.catalog_dir, args.seed, compile_binary=True)
+        entry = {'rows': rows, 'catalog': os.path.relpath(path, ROOT_DIR),
+                 'generate_s': round(time.perf_counter() - start, 1)}
+        print(f"\n== {rows} tracks ({path})")
+
+        if not args.skip_micro:
+            entry['micro'] = micro = run_child('micro', path, args.real_deepface)
+            print(f"load {micro['load_s']}s, RSS {micro['rss_mb']:.0f} MB")
+            print(f"{'method':>38} {'min us':>10} {'median us':>10}")
+            for name, result in micro['methods'].items():
+                print(f"{name:>38} {result['min_us']:>10.2f} {result['median_us']:>10.2f}")
+
+        if not args.skip_load:
+            process, port = start_server(path, args.real_deepface)
+            try:
+                entry['load'] = {}
+                print(f"{'scenario':>15} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'failed':>7}")
+                for scenario in args.scenarios:
+                    result = load_test(port, scenario, args.clients, args.duration, args.warmup, frames, args.seed)
+                    entry['load'][scenario] = result
+                    failed = result['errors'] + sum(n for s, n in result['statuses'].items() if int(s) >= 400)
+                    print(f"{scenario:>15} {result['throughput_rps']:>8.1f} {result['p50_ms']:>8.2f} "
+                          f"{result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f} {failed:>7}")
+            finally:
+                process.terminate()
+                process.wait()
+        results['catalogs'].append(entry)
+
+    output = args.output or os.path.join(
+        BENCH_DIR, 'results', datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\n✓ Results written to {output}")
+
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == '__main__':
+    main()
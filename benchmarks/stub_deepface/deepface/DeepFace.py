@@ -0,0 +1,44 @@
+"""Stand-in for DeepFace in benchmarks: no TensorFlow, no model downloads, fixed latencies
+
+Face detection returns the centre of the frame as a face and the emotion model returns
+fixed scores. STUB_DETECT_MS and STUB_EMOTION_MS (per call, plus STUB_EMOTION_PER_FACE_MS
+per face in a batch) set how long they take; they sleep, as TensorFlow releases the GIL
+while it runs.
+"""
+import os
+import time
+
+import numpy as np
+
+DETECT_SECONDS = float(os.environ.get('STUB_DETECT_MS', 20)) / 1000
+EMOTION_SECONDS = float(os.environ.get('STUB_EMOTION_MS', 15)) / 1000
+EMOTION_PER_FACE_SECONDS = float(os.environ.get('STUB_EMOTION_PER_FACE_MS', 1)) / 1000
+
+# angry, disgust, fear, happy, sad, surprise, neutral
+SCORES = np.array([0.05, 0.01, 0.02, 0.70, 0.10, 0.02, 0.10], dtype=np.float32)
+
+
+class _EmotionModel:
+    def predict(self, img):
+        img = np.asarray(img)
+        faces = 1 if img.ndim == 3 else img.shape[0]
+        time.sleep(EMOTION_SECONDS + EMOTION_PER_FACE_SECONDS * faces)
+        # Like the real model: one flat row for a single image, (n, 7) for a batch
+        return SCORES.copy() if faces == 1 else np.tile(SCORES, (faces, 1))
+
+
+_emotion_model = _EmotionModel()
+
+
+def build_model(model_name, task='facial_recognition'):
+    return _emotion_model if model_name == 'Emotion' else object()
+
+
+def extract_faces(img_path, detector_backend='opencv', enforce_detection=True, align=True,
+                  color_face='rgb', **kwargs):
+    time.sleep(DETECT_SECONDS)
+    height, width = img_path.shape[:2]
+    face = img_path[height // 4:height * 3 // 4, width // 4:width * 3 // 4]
+    return [{'face': face.astype(np.float32) / 255,
+             'facial_area': {'x': width // 4, 'y': height // 4, 'w': width // 2, 'h': height // 2},
+             'confidence': 0.99}]
@@ -0,0 +1 @@
+labels = ['angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral']
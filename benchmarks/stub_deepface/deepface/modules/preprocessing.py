@@ -0,0 +1,6 @@
+import cv2
+import numpy as np
+
+
+def resize_image(img, target_size):
+    return np.expand_dims(cv2.resize(img, target_size), axis=0)
@@ -0,0 +1,102 @@
+"""Synthetic track catalogs with the schema of data/spotify_mood_tracks_multilang.csv
+
+Rows are generated from a seed, so the same (rows, seed) always gives the same file.
+Mood and language shares follow the shipped catalog, popularity is skewed towards the
+middle like real Spotify scores, and artists/albums repeat so categorical columns have
+realistic cardinality. Large catalogs are written in chunks to keep memory flat.
+
+Usage: python benchmarks/synthetic_catalog.py 1000000 [-o data/synthetic] [--compile]
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import catalog  # noqa: E402
+
+COLUMNS = ['id', 'name', 'artist', 'album', 'popularity', 'duration_ms', 'release_date',
+           'mood', 'language', 'search_query']
+
+# Shares in the shipped catalog
+MOODS = {'Happy': 164, 'Energetic': 151, 'Sad': 150, 'Focus': 146, 'Calm': 145,
+         'Romantic': 145, 'Motivated': 133, 'Party': 122}
+LANGUAGES = {'English': 246, 'Hindi': 205, 'Tamil': 199, 'Telugu': 197, 'Kannada': 159, 'Malayalam': 150}
+
+WORDS = ('love night heart dance fire rain dream sky moon light road home summer wild river '
+         'gold star ocean city shadow storm sun world time soul song blue heaven dil pyaar '
+         'raat sapna kadhal nila mazhai prema manasu hrudaya').split()
+
+CHUNK_ROWS = 1_000_000
+
+
+def _weights(shares):
+    values = np.array(list(shares.values()), dtype=float)
+    return values / values.sum()
+
+
+def generate_tracks(rows, seed=0, start=0):
+    """DataFrame of `rows` synthetic tracks; start offsets the ids so chunks don't collide"""
+    rng = np.random.default_rng([seed, start])
+    index = np.arange(start, start + rows)
+
+    words = np.array(WORDS, dtype=object)
+    names = words[rng.integers(0, len(words), rows)] + ' ' + words[rng.integers(0, len(words), rows)]
+    # About 20 tracks per artist and 8 per album, whatever the catalog size
+    artist_ids = rng.integers(0, max(rows + start, 20) // 20, rows)
+    album_ids = rng.integers(0, max(rows + start, 8) // 8, rows)
+
+    moods = np.array(list(MOODS), dtype=object)[rng.choice(len(MOODS), rows, p=_weights(MOODS))]
+    languages = np.array(list(LANGUAGES), dtype=object)[rng.choice(len(LANGUAGES), rows, p=_weights(LANGUAGES))]
+    days = rng.integers(0, 56 * 365, rows)
+
+    return pd.DataFrame({
+        'id': pd.Series(index).map('syn{:019x}'.format),
+        'name': names,
+        'artist': pd.Series(artist_ids).map('Artist {}'.format),
+        'album': pd.Series(album_ids).map('Album {}'.format),
+        'popularity': np.clip(rng.normal(45, 18, rows), 0, 100).astype(np.int64),
+        'duration_ms': rng.integers(120_000, 420_000, rows),
+        'release_date': (np.datetime64('1970-01-01') + days).astype(str),
+        'mood': moods,
+        'language': languages,
+        'search_query': pd.Series(moods).str.lower() + ' ' + pd.Series(languages).str.lower()
+    }, columns=COLUMNS)
+
+
+def write_catalog(rows, out_dir, seed=0, compile_binary=False):
+    """Write tracks_<rows>.csv into out_dir unless it already exists; returns its path
+
+    With compile_binary the columnar catalog the app loads at startup is built next to it.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, f'tracks_{rows}_s{seed}.csv')
+    if not os.path.exists(path):
+        partial = path + '.partial'
+        with open(partial, 'w', newline='') as f:
+            for start in range(0, rows, CHUNK_ROWS):
+                chunk = generate_tracks(min(CHUNK_ROWS, rows - start), seed, start)
+                chunk.to_csv(f, index=False, header=(start == 0))
+        os.replace(partial, path)
+    if compile_binary and not catalog.is_catalog_current(catalog.catalog_path_for(path), path):
+        catalog.compile_catalog(path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('rows', type=int)
+    parser.add_argument('-o', '--output', default=os.path.join('data', 'synthetic'))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--compile', action='store_true', help='Also build the binary catalog')
+    args = parser.parse_args()
+
+    path = write_catalog(args.rows, args.output, args.seed, args.compile)
+    print(f"✓ {args.rows} tracks -> {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+# Binary catalog layout (one directory per compiled CSV):
+#   meta.json            row count, column kinds and the source CSV's size/mtime
+#   <col>.npy            numeric columns, memory-mapped on load
+#   <col>.codes.npy      categorical columns: int codes into <col>.strings, memory-mapped too
+#   <col>.strings        NUL-separated UTF-8 string table
+CATALOG_FORMAT_VERSION = 2
+DEFAULT_CSV_PATH = 'data/spotify_mood_tracks_multilang.csv'
+SEPARATOR = '\x00'
+
+# In-memory layout of the tracks table: low-cardinality text as categoricals, narrow
+# integers, release_date reduced to a year, and columns the serving path never reads dropped
+CATEGORICAL_COLUMNS = ['mood', 'language', 'artist', 'album']
+UNUSED_COLUMNS = ['search_query']
+
+
+def compact_tracks(tracks_df):
+    """Convert a raw tracks table to the memory-compact layout (no-op if already compact)"""
+    tracks_df = tracks_df.drop(columns=[c for c in UNUSED_COLUMNS if c in tracks_df.columns])
+    for column in CATEGORICAL_COLUMNS:
+        if column in tracks_df.columns and not isinstance(tracks_df[column].dtype, pd.CategoricalDtype):
+            tracks_df[column] = tracks_df[column].astype('category')
+    for column in ['popularity', 'duration_ms']:
+        if column in tracks_df.columns:
+            tracks_df[column] = pd.to_numeric(tracks_df[column], downcast='unsigned')
+    if 'release_date' in tracks_df.columns:
+        # Dates come as '2014-04-01', '2014-04' or '2014'; the year is all anyone reads
+        years = pd.to_numeric(tracks_df['release_date'].astype(str).str[:4], errors='coerce')
+        tracks_df['release_year'] = years.fillna(0).astype(np.uint16)
+        tracks_df = tracks_df.drop(columns=['release_date'])
+    return tracks_df
+
+
+def bytes_per_row(tracks_df):
+    """Deep memory usage of a tracks table divided by its row count"""
+    return tracks_df.memory_usage(deep=True).sum() / max(len(tracks_df), 1)
+
+
+def catalog_path_for(csv_path):
+    """Default compiled catalog directory for a CSV file"""
+    return os.path.splitext(csv_path)[0] + '.catalog'
+
+
+def _write_strings(path, values):
+    values = ['' if pd.isna(value) else str(value) for value in values]
+    if any(SEPARATOR in value for value in values):
+        raise ValueError(f"String column for {path} contains a NUL character")
+    with open(path, 'wb') as f:
+        f.write(SEPARATOR.join(values).encode('utf-8'))
+
+
+def _read_strings(path, count):
+    with open(path, 'rb') as f:
+        data = f.read().decode('utf-8')
+    # One C-level split instead of decoding row by row
+    values = data.split(SEPARATOR) if count else []
+    if len(values) != count:
+        raise ValueError(f"Expected {count} strings in {path}, found {len(values)}")
+    return values
+
+
+def _write_catalog(tracks_df, csv_path, out_dir):
+    columns = {}
+    for column in tracks_df.columns:
+        series = tracks_df[column]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            np.save(os.path.join(out_dir, f'{column}.codes.npy'), series.cat.codes.to_numpy())
+            _write_strings(os.path.join(out_dir, f'{column}.strings'), series.cat.categories)
+            columns[column] = {'kind': 'categorical', 'categories': len(series.cat.categories)}
+        elif pd.api.types.is_numeric_dtype(series.dtype):
+            np.save(os.path.join(out_dir, f'{column}.npy'), series.to_numpy())
+            columns[column] = 'numeric'
+        else:
+            _write_strings(os.path.join(out_dir, f'{column}.strings'), series)
+            columns[column] = 'string'
+
+    stat = os.stat(csv_path)
+    meta = {
+        'version': CATALOG_FORMAT_VERSION,
+        'rows': len(tracks_df),
+        'columns': columns,
+        'source_size': stat.st_size,
+        'source_mtime': stat.st_mtime
+    }
+    # meta.json goes last so a half-written catalog is never picked up
+    with open(os.path.join(out_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+
+def compile_catalog(csv_path, out_dir=None):
+    """Compile a tracks CSV into the columnar binary catalog format (compact layout)
+
+    The catalog is written to a temporary sibling directory and swapped in whole, so
+    processes that memory-mapped the previous catalog keep reading intact files.
+    """
+    out_dir = os.path.normpath(out_dir or catalog_path_for(csv_path))
+    tracks_df = compact_tracks(pd.read_csv(csv_path))
+    parent = os.path.dirname(out_dir) or '.'
+    tmp_dir = tempfile.mkdtemp(prefix=os.path.basename(out_dir) + '.tmp.', dir=parent)
+    try:
+        _write_catalog(tracks_df, csv_path, tmp_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    os.chmod(tmp_dir, 0o755)  # mkdtemp creates it private
+
+    # Move the old catalog aside rather than overwriting it: its files are unlinked, not
+    # truncated, so existing mappings stay valid until their processes reload
+    old_dir = None
+    if os.path.exists(out_dir):
+        old_dir = tempfile.mkdtemp(prefix=os.path.basename(out_dir) + '.old.', dir=parent)
+        os.replace(out_dir, old_dir)
+    os.replace(tmp_dir, out_dir)
+    if old_dir:
+        shutil.rmtree(old_dir, ignore_errors=True)
+    return out_dir
+
+
+def read_catalog(catalog_dir):
+    """Load a compiled catalog into a DataFrame whose numeric columns and categorical codes are memory-mapped"""
+    with open(os.path.join(catalog_dir, 'meta.json')) as f:
+        meta = json.load(f)
+    if meta.get('version') != CATALOG_FORMAT_VERSION:
+        raise ValueError(f"Unsupported catalog format version: {meta.get('version')}")
+
+    rows = meta['rows']
+    data = {}
+    for column, kind in meta['columns'].items():
+        if kind == 'numeric':
+            data[column] = np.load(os.path.join(catalog_dir, f'{column}.npy'), mmap_mode='r')
+        elif kind == 'string':
+            data[column] = _read_strings(os.path.join(catalog_dir, f'{column}.strings'), rows)
+        else:
+            codes = np.load(os.path.join(catalog_dir, f'{column}.codes.npy'), mmap_mode='r')
+            categories = _read_strings(os.path.join(catalog_dir, f'{column}.strings'), kind['categories'])
+            data[column] = pd.Categorical.from_codes(codes, categories)
+    # copy=False keeps the frame's columns as views of the read-only mappings; the default
+    # copies every array into memory. Nothing on the serving path writes to the table.
+    return pd.DataFrame(data, copy=False)
+
+
+def is_catalog_current(catalog_dir, csv_path):
+    """Check that a compiled catalog exists and was built from the CSV as it is now"""
+    try:
+        with open(os.path.join(catalog_dir, 'meta.json')) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if not os.path.exists(csv_path):
+        return True  # shipped without the CSV, the catalog is all there is
+    stat = os.stat(csv_path)
+    return meta.get('source_size') == stat.st_size and meta.get('source_mtime') == stat.st_mtime
+
+
+def catalog_version(csv_path):
+    """Version of the catalog load_catalog(csv_path) reads, from its source file's mtime (ns) and size
+
+    That is the CSV, or meta.json when the compiled catalog is shipped without it. Raises
+    OSError when there is neither.
+    """
+    path = csv_path
+    if not os.path.exists(csv_path):
+        path = os.path.join(catalog_path_for(csv_path), 'meta.json')
+    stat = os.stat(path)
+    return f'{stat.st_mtime_ns}-{stat.st_size}'
+
+
+def load_catalog(csv_path):
+    """Load the compact tracks table, preferring an up-to-date compiled catalog over parsing the CSV"""
+    catalog_dir = catalog_path_for(csv_path)
+    if is_catalog_current(catalog_dir, csv_path):
+        return read_catalog(catalog_dir)
+    if os.path.exists(os.path.join(catalog_dir, 'meta.json')):
+        print(f"Compiled catalog {catalog_dir} is stale, reading {csv_path} (run: python catalog.py compile)")
+    tracks_df = pd.read_csv(csv_path)
+    before = bytes_per_row(tracks_df)
+    tracks_df = compact_tracks(tracks_df)
+    print(f"✓ Compacted tracks table: {before:.0f} -> {bytes_per_row(tracks_df):.0f} bytes/row")
+    return tracks_df
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Moodify catalog tools')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    compile_parser = subparsers.add_parser('compile', help='Compile a tracks CSV into the binary catalog format')
+    compile_parser.add_argument('csv', nargs='?', default=DEFAULT_CSV_PATH)
+    compile_parser.add_argument('-o', '--output', help='Output directory (default: <csv name>.catalog)')
+    args = parser.parse_args()
+
+    if args.command == 'compile':
+        start = time.perf_counter()
+        out_dir = compile_catalog(args.csv, args.output)
+        print(f"✓ Compiled {args.csv} -> {out_dir} in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
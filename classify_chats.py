@@ -0,0 +1,173 @@
+import argparse
+import contextlib
+import csv
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from catalog import DEFAULT_CSV_PATH
+from mood_recommender import build_recommender
+
+# Offline mood/language classification of archived chat messages.
+#
+#   python classify_chats.py chats.jsonl -o scored.jsonl
+#   python classify_chats.py chats.csv -o scored.csv --field text --workers 8
+#
+# Input is streamed in chunks and at most a few chunks per worker are in flight, so
+# memory stays flat however large the file is. Every output record is the input record
+# with detected_mood and detected_language added, in input order.
+
+_detector = None
+
+
+def load_detector(catalog_path):
+    """Build the recommender for a catalog, keeping its load messages off stdout
+
+    Built from the catalog directly rather than imported from app, whose import starts
+    the web app's emotion workers, session store and catalog watcher.
+    """
+    with contextlib.redirect_stdout(sys.stderr):
+        return build_recommender(catalog_path)
+
+
+def _init_worker(catalog_path):
+    """Build the keyword matchers once per worker process"""
+    global _detector
+    # Already built when the pool forks; built fresh under spawn
+    if _detector is None:
+        _detector = load_detector(catalog_path)
+
+
+def _classify_chunk(messages):
+    return [None if message is None else _detector.classify_message(message) for message in messages]
+
+
+def read_records(path, fmt, field):
+    """Yield (record, message) pairs from a JSONL or CSV file ('-' for stdin)
+
+    A JSONL line that is not a JSON object yields an {"error": ...} record and no message,
+    so it is written through unclassified instead of ending the job.
+    """
+    f = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+    try:
+        if fmt == 'csv':
+            for record in csv.DictReader(f):
+                yield record, record.get(field) or ''
+        else:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                    message = str(record.get(field) or '')
+                except (ValueError, AttributeError) as e:
+                    yield {'error': f'Invalid line: {e}'}, None
+                    continue
+                yield record, message
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+class RecordWriter:
+    """Write classified records as JSONL or CSV ('-' for stdout)"""
+
+    def __init__(self, path, fmt):
+        self.fmt = fmt
+        self.f = sys.stdout if path == '-' else open(path, 'w', newline='', encoding='utf-8')
+        self.csv_writer = None
+
+    def write(self, record):
+        if self.fmt == 'csv':
+            if self.csv_writer is None:
+                self.csv_writer = csv.DictWriter(self.f, fieldnames=list(record), extrasaction='ignore')
+                self.csv_writer.writeheader()
+            self.csv_writer.writerow(record)
+        else:
+            self.f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def close(self):
+        if self.f is not sys.stdout:
+            self.f.close()
+
+
+def chunked(records, size):
+    chunk = []
+    for item in records:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def detect_format(path, fmt):
+    if fmt:
+        return fmt
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+
+def main():
+    global _detector
+    parser = argparse.ArgumentParser(description='Classify mood and language of archived chat messages')
+    parser.add_argument('input', help="JSONL or CSV file, '-' for stdin")
+    parser.add_argument('-o', '--output', default='-', help="Output file (default: stdout)")
+    parser.add_argument('--format', choices=['jsonl', 'csv'], help='Input/output format (default: from extension)')
+    parser.add_argument('--field', default='message', help='Field holding the message text (default: message)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk-size', type=int, default=2000)
+    parser.add_argument('--catalog', default=os.environ.get('CATALOG_PATH', DEFAULT_CSV_PATH),
+                        help='Tracks CSV, or where its compiled catalog was built from (default: $CATALOG_PATH or the shipped one)')
+    args = parser.parse_args()
+
+    in_format = detect_format(args.input, args.format)
+    out_format = detect_format(args.output, args.format) if args.output != '-' else in_format
+    writer = RecordWriter(args.output, out_format)
+    max_in_flight = args.workers * 2
+
+    _detector = load_detector(args.catalog)  # once in the parent so forked workers inherit it
+
+    start = time.perf_counter()
+    total = 0
+    errors = 0
+    pending = deque()  # (records, future) in input order
+
+    def drain_one():
+        nonlocal total, errors
+        records, future = pending.popleft()
+        for (record, _), result in zip(records, future.result()):
+            if result is None:
+                errors += 1
+            else:
+                record.update(result)
+            writer.write(record)
+        total += len(records)
+
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                                 initargs=(args.catalog,)) as pool:
+            for chunk in chunked(read_records(args.input, in_format, args.field), args.chunk_size):
+                # Backpressure: don't read further ahead than the workers can take
+                if len(pending) >= max_in_flight:
+                    drain_one()
+                pending.append((chunk, pool.submit(_classify_chunk, [message for _, message in chunk])))
+            while pending:
+                drain_one()
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    rate = total / elapsed if elapsed > 0 else 0
+    print(f"✓ Classified {total} messages in {elapsed:.2f}s ({rate:,.0f} messages/s, {args.workers} workers)",
+          file=sys.stderr)
+    if errors:
+        print(f"{errors} invalid lines written as error records", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
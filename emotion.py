@@ -0,0 +1,991 @@
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import metrics
+
+# Facial emotion detection (DeepFace + OpenCV), kept resident per process.
+#
+# cv2, numpy and DeepFace are imported on first use so the chat and recommender routes
+# start fast; warmup() builds the emotion model and every detector backend once, after
+# which DeepFace reuses them from its model cache on every request.
+
+# Try multiple detector backends for better reliability
+DETECTORS = ['retinaface', 'mtcnn', 'opencv', 'ssd']
+
+# Map DeepFace emotions to our mood categories
+EMOTION_TO_MOOD = {
+    'happy': 'Happy',
+    'sad': 'Sad',
+    'angry': 'Energetic',
+    'surprise': 'Happy',  # Changed from Excited to Happy
+    'fear': 'Calm',
+    'disgust': 'Focus',
+    'neutral': 'Calm'
+}
+
+# Below this dominant-emotion score (percent) a frame is treated as neutral / Calm
+MIN_CONFIDENCE = 30.0
+
+# Per-request time budget for the detector cascade (EMOTION_TIME_BUDGET_MS, 0 = unlimited)
+TIME_BUDGET_MS = float(os.environ.get('EMOTION_TIME_BUDGET_MS', 3000)) or None
+
+
+def _env_flag(name, default):
+    return os.environ.get(name, str(default)).lower() in ('1', 'true', 'yes', 'on')
+
+
+# Frame preprocessing. Large JPEGs are decoded straight at 1/2, 1/4 or 1/8 scale (libjpeg
+# DCT scaling) before the final resize to MAX_WIDTH. The brightness threshold applies to
+# the mean of the LAB L channel (0-255); 129 matches the old grayscale threshold of 120
+# for an evenly lit frame.
+MAX_WIDTH = int(os.environ.get('EMOTION_MAX_WIDTH', 480))
+REDUCED_DECODE = _env_flag('EMOTION_REDUCED_DECODE', True)
+CLAHE_ENABLED = _env_flag('EMOTION_CLAHE', True)
+CLAHE_CLIP_LIMIT = float(os.environ.get('EMOTION_CLAHE_CLIP', 3.0))
+BRIGHTNESS_BOOST = _env_flag('EMOTION_BRIGHTNESS_BOOST', True)
+BRIGHTNESS_THRESHOLD = float(os.environ.get('EMOTION_BRIGHTNESS_THRESHOLD', 129))
+
+# Per-session result cache: a frame whose 64-bit dHash is within EMOTION_CACHE_DISTANCE bits
+# of one analyzed in the last EMOTION_CACHE_TTL_SECONDS gets that result back
+# (EMOTION_CACHE_TTL_SECONDS=0 disables the cache)
+CACHE_TTL_SECONDS = float(os.environ.get('EMOTION_CACHE_TTL_SECONDS', 2))
+CACHE_MAX_DISTANCE = int(os.environ.get('EMOTION_CACHE_DISTANCE', 4))
+CACHE_MAX_SESSIONS = int(os.environ.get('EMOTION_CACHE_SESSIONS', 1000))
+CACHE_ENTRIES_PER_SESSION = int(os.environ.get('EMOTION_CACHE_ENTRIES', 4))
+
+# Micro-batching of the emotion model: face crops that arrive within EMOTION_BATCH_WAIT_MS
+# of each other are classified in one forward pass of up to EMOTION_BATCH_MAX faces
+# (EMOTION_BATCH_MAX=1, the default, classifies every frame on its own)
+BATCH_MAX = int(os.environ.get('EMOTION_BATCH_MAX', 1))
+BATCH_WAIT_MS = float(os.environ.get('EMOTION_BATCH_WAIT_MS', 10))
+
+_warmup_lock = threading.Lock()
+_ready = threading.Event()
+warmup_status = {'state': 'cold', 'seconds': None, 'error': None, 'detectors': []}
+
+
+class EmotionDetectionError(Exception):
+    """Detection failed in a way the client should see (bad image, no face)"""
+
+    def __init__(self, payload, status=400):
+        super().__init__(payload.get('error'))
+        self.payload = payload
+        self.status = status
+        self.headers = {}
+
+
+def warmup():
+    """Build the emotion model and detector backends once for this process"""
+    with _warmup_lock:
+        if _ready.is_set():
+            return
+        warmup_status['state'] = 'warming'
+        start = time.perf_counter()
+        try:
+            import numpy as np
+            from deepface import DeepFace
+
+            DeepFace.build_model(model_name='Emotion', task='facial_attribute')
+            detectors = []
+            for detector in DETECTORS:
+                try:
+                    DeepFace.build_model(model_name=detector, task='face_detector')
+                    detectors.append(detector)
+                except Exception as e:
+                    print(f"Warmup: {detector} detector unavailable: {e}")
+
+            # Dummy passes so TensorFlow traces its graphs (single image, and batched when
+            # batching is on) now rather than on the first frames
+            blank_face = np.zeros((224, 224, 3), dtype=np.float32)
+            classify_faces([blank_face])
+            if BATCH_MAX > 1:
+                classify_faces([blank_face, blank_face])
+            preprocess(np.zeros((360, MAX_WIDTH, 3), dtype=np.uint8))  # first OpenCV call pays for its setup
+
+            warmup_status['detectors'] = detectors
+            warmup_status['state'] = 'ready'
+            warmup_status['error'] = None
+            _ready.set()
+            print(f"✓ Emotion models ready in {time.perf_counter() - start:.1f}s (detectors: {', '.join(detectors)})")
+        except Exception as e:
+            warmup_status['state'] = 'failed'
+            warmup_status['error'] = str(e)
+            print(f"Emotion model warmup failed: {e}")
+        finally:
+            warmup_status['seconds'] = round(time.perf_counter() - start, 2)
+
+
+def start_warmup(mode='background'):
+    """Warm the models at startup: 'eager' blocks, 'background' uses a thread, 'off' waits for the first request"""
+    if mode == 'eager':
+        warmup()
+    elif mode == 'background':
+        threading.Thread(target=warmup, name='emotion-warmup', daemon=True).start()
+
+
+def is_ready():
+    if _pool is not None:
+        return _pool.is_ready()
+    return _ready.is_set()
+
+
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def jpeg_size(img_bytes):
+    """(width, height, has_exif) from a JPEG header without decoding, None if not a JPEG"""
+    data = memoryview(img_bytes)
+    if data[:2] != b'\xff\xd8':
+        return None
+    has_exif = False
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        length = int.from_bytes(data[i + 2:i + 4], 'big')
+        if marker in _JPEG_SOF_MARKERS:
+            height = int.from_bytes(data[i + 5:i + 7], 'big')
+            width = int.from_bytes(data[i + 7:i + 9], 'big')
+            return width, height, has_exif
+        if marker == 0xE1 and data[i + 4:i + 8] == b'Exif':
+            has_exif = True
+        i += 2 + length
+    return None
+
+
+def _reduced_decode_flag(img_bytes, max_width):
+    """Largest IMREAD_REDUCED_COLOR_* scale that still leaves the frame at least max_width wide"""
+    import cv2
+
+    size = jpeg_size(img_bytes)
+    if size is None:
+        return cv2.IMREAD_COLOR
+    width, height, has_exif = size
+    if has_exif:
+        width = min(width, height)  # the EXIF orientation may turn the frame sideways
+    for factor, flag in ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                         (2, cv2.IMREAD_REDUCED_COLOR_2)):
+        if width // factor >= max_width:
+            return flag
+    return cv2.IMREAD_COLOR
+
+
+def decode_image(img_bytes, max_width=None):
+    """Decode JPEG/PNG bytes into a BGR image at most max_width wide (None if the data isn't an image)"""
+    import cv2
+    import numpy as np
+
+    max_width = max_width or MAX_WIDTH
+    flag = _reduced_decode_flag(img_bytes, max_width) if REDUCED_DECODE else cv2.IMREAD_COLOR
+    img = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), flag)
+    if img is None:
+        return None
+
+    # Resize to smaller frame for faster processing (max 480px width for speed)
+    height, width = img.shape[:2]
+    if width > max_width:
+        scale = max_width / width
+        img = cv2.resize(img, (max_width, int(height * scale)), interpolation=cv2.INTER_AREA)
+    return img
+
+
+# Scratch arrays and CLAHE objects per thread (request threads, stream tickers, pool workers)
+_scratch = threading.local()
+
+
+def _buffer(name, shape):
+    """Per-thread scratch array, reallocated only when the frame size changes"""
+    import numpy as np
+
+    buffers = getattr(_scratch, 'buffers', None)
+    if buffers is None:
+        buffers = _scratch.buffers = {}
+    array = buffers.get(name)
+    if array is None or array.shape != shape:
+        array = buffers[name] = np.empty(shape, np.uint8)
+    return array
+
+
+def _clahe():
+    import cv2
+
+    clahe = getattr(_scratch, 'clahe', None)
+    if clahe is None:
+        clahe = _scratch.clahe = cv2.createCLAHE(clipLimit=CLAHE_CLIP_LIMIT, tileGridSize=(8, 8))
+    return clahe
+
+
+def preprocess(img):
+    """Enhance a decoded frame for face detection
+
+    One BGR->LAB conversion feeds both steps: CLAHE (Contrast Limited Adaptive Histogram
+    Equalization) on the L channel, and the brightness check on the mean of that same
+    channel. Intermediate frames live in per-thread buffers. The returned image may be
+    one of those buffers, so it is only valid until the thread's next call.
+    """
+    import cv2
+
+    if not (CLAHE_ENABLED or BRIGHTNESS_BOOST):
+        return img
+
+    lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB, dst=_buffer('lab', img.shape))
+    l = cv2.extractChannel(lab, 0, dst=_buffer('l', img.shape[:2]))
+    if CLAHE_ENABLED:
+        _clahe().apply(l, dst=l)
+        cv2.insertChannel(l, lab, 0)
+        img = cv2.cvtColor(lab, cv2.COLOR_LAB2BGR, dst=_buffer('bgr', img.shape))
+
+    # Increase brightness and contrast for dark images
+    if BRIGHTNESS_BOOST and cv2.mean(l)[0] < BRIGHTNESS_THRESHOLD:
+        img = cv2.convertScaleAbs(img, dst=img, alpha=1.3, beta=40)
+    return img
+
+
+def frame_hash(img_bytes):
+    """64-bit difference hash (dHash) of an encoded frame, None if it can't be decoded
+
+    Decodes a 1/8-scale grayscale copy and compares horizontally adjacent pixels of a 9x8
+    thumbnail, so it costs a fraction of a millisecond and ignores small changes in
+    lighting, compression and position between consecutive webcam frames.
+    """
+    import cv2
+    import numpy as np
+
+    gray = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if gray is None:
+        return None
+    thumb = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    return int.from_bytes(np.packbits(thumb[:, 1:] > thumb[:, :-1]).tobytes(), 'big')
+
+
+class EmotionCache:
+    """Recent results per session, looked up by perceptual-hash distance
+
+    Each session keeps its last entries_per_session results with their frame hashes; a
+    frame within max_distance bits of a fresh entry reuses the nearest one. Sessions are
+    evicted least recently used beyond max_sessions, entries once older than ttl_seconds.
+    """
+
+    def __init__(self, ttl_seconds=2.0, max_distance=4, max_sessions=1000, entries_per_session=4):
+        self.ttl_seconds = ttl_seconds
+        self.max_distance = max_distance
+        self.max_sessions = max_sessions
+        self.entries_per_session = entries_per_session
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()  # session_id -> [(hash, stored_at, payload)], oldest first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, session_id, frame_hash):
+        """Cached payload for a near-identical recent frame, or None"""
+        now = time.monotonic()
+        with self._lock:
+            entries = self._sessions.get(session_id)
+            best = None
+            if entries:
+                entries[:] = [e for e in entries if now - e[1] <= self.ttl_seconds]
+                for entry_hash, _, payload in entries:
+                    distance = (entry_hash ^ frame_hash).bit_count()
+                    if distance <= self.max_distance and (best is None or distance < best[0]):
+                        best = (distance, payload)
+                self._sessions.move_to_end(session_id)
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return {**best[1], 'cached': True, 'cache_distance': best[0]}
+
+    def store(self, session_id, frame_hash, payload):
+        with self._lock:
+            entries = self._sessions.setdefault(session_id, [])
+            entries.append((frame_hash, time.monotonic(), payload))
+            del entries[:-self.entries_per_session]
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'sessions': len(self._sessions),
+                'entries': sum(len(entries) for entries in self._sessions.values()),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else None,
+                'evictions': self.evictions,
+                'ttl_seconds': self.ttl_seconds,
+                'max_distance': self.max_distance
+            }
+
+
+# Results are kept without the per-request diagnostics
+_UNCACHED_FIELDS = ('attempts', 'timings')
+
+result_cache = EmotionCache(CACHE_TTL_SECONDS, CACHE_MAX_DISTANCE, CACHE_MAX_SESSIONS,
+                            CACHE_ENTRIES_PER_SESSION) if CACHE_TTL_SECONDS > 0 else None
+
+
+class DetectorCascade:
+    """Orders face detectors by measured latency and success rate
+
+    Each attempt updates an exponentially weighted latency and a face-found count per
+    detector. plan() puts the detector with the lowest expected time to find a face first
+    (latency / smoothed success rate). Detectors with too few samples are promoted to the
+    front until they have some, and every explore_every plans the least tried one is
+    promoted again so the ranking keeps up with changing conditions.
+    """
+
+    def __init__(self, detectors, min_samples=3, explore_every=50, alpha=0.2):
+        self.detectors = list(detectors)
+        self.min_samples = min_samples
+        self.explore_every = explore_every
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._plans = 0
+        self._stats = {d: {'attempts': 0, 'faces': 0, 'errors': 0, 'answered': 0, 'ewma_ms': None}
+                       for d in self.detectors}
+
+    def _expected_ms(self, detector):
+        stats = self._stats[detector]
+        if stats['ewma_ms'] is None:
+            return 0.0
+        success_rate = (stats['faces'] + 1) / (stats['attempts'] + 2)  # Laplace smoothing
+        return stats['ewma_ms'] / success_rate
+
+    def latency_ms(self, detector):
+        """Smoothed latency of one attempt with this detector (0 if never tried)"""
+        stats = self._stats.get(detector)
+        return (stats and stats['ewma_ms']) or 0.0
+
+    def latencies(self):
+        """latency_ms() of every detector, for a pool worker whose own cascade never sees results"""
+        with self._lock:
+            return {d: s['ewma_ms'] or 0.0 for d, s in self._stats.items()}
+
+    def plan(self):
+        """Detector order for the next request"""
+        with self._lock:
+            self._plans += 1
+            ranked = sorted(self.detectors, key=self._expected_ms)
+            undersampled = [d for d in self.detectors if self._stats[d]['attempts'] < self.min_samples]
+            if undersampled:
+                promote = undersampled[0]
+            elif self._plans % self.explore_every == 0:
+                promote = min(self.detectors, key=lambda d: self._stats[d]['attempts'])
+            else:
+                return ranked
+            return [promote] + [d for d in ranked if d != promote]
+
+    def record(self, attempts, answered_by=None):
+        """Fold one request's attempts into the statistics"""
+        with self._lock:
+            for attempt in attempts:
+                stats = self._stats.get(attempt['detector'])
+                if stats is None:
+                    continue
+                stats['attempts'] += 1
+                if attempt.get('error'):
+                    stats['errors'] += 1
+                elif attempt.get('face_found'):
+                    stats['faces'] += 1
+                ms = attempt['ms']
+                stats['ewma_ms'] = ms if stats['ewma_ms'] is None else (
+                    self.alpha * ms + (1 - self.alpha) * stats['ewma_ms'])
+            if answered_by in self._stats:
+                self._stats[answered_by]['answered'] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                d: {**s, 'ewma_ms': round(s['ewma_ms'], 1) if s['ewma_ms'] is not None else None,
+                    'face_rate': round(s['faces'] / s['attempts'], 3) if s['attempts'] else None}
+                for d, s in self._stats.items()
+            }
+
+
+# Shared by every request in this process
+cascade = DetectorCascade(DETECTORS)
+
+
+class StageTimings:
+    """Count, mean and max of each pipeline stage's duration (decode, preprocess, detect, classify)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def record(self, timings):
+        if not timings:
+            return
+        with self._lock:
+            for stage, ms in timings.items():
+                stats = self._stages.setdefault(stage, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+                stats['count'] += 1
+                stats['total_ms'] += ms
+                stats['max_ms'] = max(stats['max_ms'], ms)
+
+    def stats(self):
+        with self._lock:
+            return {
+                stage: {'count': s['count'], 'avg_ms': round(s['total_ms'] / s['count'], 2),
+                        'max_ms': round(s['max_ms'], 2)}
+                for stage, s in self._stages.items()
+            }
+
+
+stage_timings = StageTimings()
+
+
+def detect_face(img, detectors=None, budget_ms=None, latencies=None):
+    """Find a face, cascading through detector backends within a time budget
+
+    Stops at the first detector that finds a face. A pass where the detector found no face
+    (DeepFace then returns the whole frame) is kept as the fallback while later detectors
+    are tried. Once budget_ms is spent, or the next detector is expected to overrun it,
+    the best crop so far is returned. Expected latencies come from latencies (detector ->
+    ms, as cascade.latencies() returns them) when given, else from this process's cascade.
+    Returns (face crop or None, detector that answered, attempts, last error).
+    """
+    from deepface import DeepFace
+
+    if not _ready.is_set():
+        warmup()  # first request when warmup was off, or still running in the background
+
+    detectors = detectors or DETECTORS
+    start = time.perf_counter()
+    attempts = []
+    best = None
+    answered_by = None
+    last_error = None
+
+    for detector in detectors:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if budget_ms is not None and best is not None:
+            expected_ms = latencies.get(detector, 0.0) if latencies is not None else cascade.latency_ms(detector)
+            if elapsed_ms >= budget_ms or elapsed_ms + expected_ms > budget_ms:
+                print(f"Time budget used ({elapsed_ms:.0f}ms of {budget_ms}ms), skipping {detector}")
+                break
+
+        attempt_start = time.perf_counter()
+        try:
+            faces = DeepFace.extract_faces(
+                img,
+                detector_backend=detector,
+                enforce_detection=False,  # Don't require face detection
+                align=True,  # Align faces for better accuracy
+                color_face='bgr'
+            )
+        except Exception as e:
+            last_error = str(e)
+            attempts.append({'detector': detector, 'ms': _ms_since(attempt_start), 'error': last_error})
+            print(f"{detector} detector failed: {last_error}")
+            continue
+
+        face_found = bool(faces) and faces[0].get('confidence', 0) > 0
+        attempts.append({'detector': detector, 'ms': _ms_since(attempt_start), 'face_found': face_found})
+
+        if faces and (best is None or face_found):
+            best = faces[0]
+            answered_by = detector
+        if face_found:
+            break  # Success, exit loop
+
+        if budget_ms is not None and (time.perf_counter() - start) * 1000 >= budget_ms:
+            break
+
+    return best, answered_by, attempts, last_error
+
+
+def _ms_since(start):
+    return round((time.perf_counter() - start) * 1000, 1)
+
+
+def build_response(result):
+    """Turn a DeepFace result into the /detect-emotion response payload"""
+    emotions = result.get('emotion', {})
+    dominant_emotion = result.get('dominant_emotion', 'neutral')
+
+    # Convert all NumPy types to Python native types (fix JSON serialization)
+    emotions_clean = {}
+    for key, value in emotions.items():
+        # Convert numpy.float32/float64 to Python float
+        if hasattr(value, 'item'):
+            emotions_clean[key] = float(value.item())
+        else:
+            emotions_clean[key] = float(value)
+
+    # Get the detected mood
+    detected_mood = EMOTION_TO_MOOD.get(dominant_emotion.lower(), 'Happy')
+
+    # Get confidence score and convert to Python float
+    confidence = emotions_clean.get(dominant_emotion, 0.0)
+
+    # Apply confidence threshold for stability (only accept if confidence > 30%)
+    if confidence < MIN_CONFIDENCE:
+        # If confidence is low, use neutral/calm mood
+        detected_mood = 'Calm'
+        dominant_emotion = 'neutral'
+
+    return {
+        'success': True,
+        'detected_mood': str(detected_mood),  # Ensure string type
+        'dominant_emotion': str(dominant_emotion),  # Ensure string type
+        'confidence': round(float(confidence), 2),
+        'all_emotions': {k: round(float(v), 2) for k, v in emotions_clean.items()},
+        'message': f"Detected {dominant_emotion} expression! Suggesting {detected_mood} music."
+    }
+
+
+def face_input(face):
+    """Emotion model input for a detected face: 224x224 BGR, letterboxed as DeepFace.analyze does"""
+    from deepface.modules import preprocessing
+
+    return preprocessing.resize_image(img=face['face'], target_size=(224, 224))[0]
+
+
+def classify_faces(face_inputs):
+    """Run the emotion model once over a batch of face inputs; one score dict (percent) per face"""
+    import numpy as np
+    from deepface import DeepFace
+    from deepface.models.demography import Emotion
+
+    model = DeepFace.build_model(model_name='Emotion', task='facial_attribute')
+    # predict() returns (n, 7) for a batch but a flat row for a single image
+    predictions = np.asarray(model.predict(np.stack(face_inputs))).reshape(len(face_inputs), -1)
+    return [{label: float(100 * p / row.sum()) for label, p in zip(Emotion.labels, row)}
+            for row in predictions]
+
+
+def detect_frame(img_bytes, detectors=None, budget_ms=None, latencies=None):
+    """Decode, preprocess and find the face in one encoded frame
+
+    Returns the emotion model input for the face and the diagnostics for the response
+    ('detector', 'attempts' and 'timings', which let the caller update the cascade and
+    stage statistics). Raises EmotionDetectionError, with the same diagnostics, when the
+    frame can't be decoded or no detector produced anything.
+    """
+    start = time.perf_counter()
+    img = decode_image(img_bytes)
+    if img is None:
+        raise EmotionDetectionError({'error': 'Invalid image data'})
+    decoded = time.perf_counter()
+
+    img = preprocess(img)
+    preprocessed = time.perf_counter()
+    face, answered_by, attempts, last_error = detect_face(img, detectors, budget_ms, latencies)
+    timings = {
+        'decode_ms': round((decoded - start) * 1000, 2),
+        'preprocess_ms': round((preprocessed - decoded) * 1000, 2),
+        'detect_ms': _ms_since(preprocessed)
+    }
+
+    if face is None:
+        if last_error is None:
+            raise EmotionDetectionError({
+                'error': 'No face detected in image',
+                'details': 'Please ensure your face is clearly visible and try again.',
+                'attempts': attempts,
+                'timings': timings
+            })
+        # If all detectors failed, return error
+        print(f"All detectors failed. Last error: {last_error}")
+        raise EmotionDetectionError({
+            'error': 'Could not detect face in image',
+            'details': 'Please ensure your face is clearly visible, well-lit, and facing the camera directly.',
+            'debug': last_error,
+            'attempts': attempts,
+            'timings': timings
+        })
+
+    # IMAGE IS AUTOMATICALLY DELETED - Python variables are garbage collected
+    # No need to manually delete, img and result will be cleared from memory
+    return face_input(face), {'detector': answered_by, 'attempts': attempts, 'timings': timings}
+
+
+def finish_response(scores, details, classify_ms):
+    """Response payload for one frame from its emotion scores and detect_frame() diagnostics"""
+    response = build_response({'emotion': scores, 'dominant_emotion': max(scores, key=scores.get)})
+    response.update(details)
+    response['timings']['classify_ms'] = classify_ms
+    return response
+
+
+def run_pipeline(img_bytes, detectors=None, budget_ms=None):
+    """Decode, preprocess, detect and classify one encoded frame in this thread"""
+    face, details = detect_frame(img_bytes, detectors, budget_ms)
+    start = time.perf_counter()
+    if _classify_batcher is not None:
+        scores = _classify_batcher.submit(face).result()
+    else:
+        scores = classify_faces([face])[0]
+    return finish_response(scores, details, _ms_since(start))
+
+
+def _pool_worker_init():
+    """Runs once in each pool process: load the models before taking frames"""
+    warmup()
+
+
+def _pool_ping():
+    return dict(warmup_status)
+
+
+def _pool_detect_batch(frames):
+    """Pool task for one or more frames: find each face, then classify them in one model call
+
+    frames are (img_bytes, detectors, latencies, budget_ms, enqueued_at) tuples; detectors
+    and latencies come from the parent's cascade, the only one that sees results. Returns
+    one outcome per frame, in order, including how long the frame waited before work on it
+    started.
+    """
+    outcomes = [None] * len(frames)
+    faces = []  # (index, face input, diagnostics)
+    for index, (img_bytes, detectors, latencies, budget_ms, enqueued_at) in enumerate(frames):
+        wait_ms = round((time.time() - enqueued_at) * 1000, 1)
+        try:
+            face, details = detect_frame(img_bytes, detectors, budget_ms, latencies)
+        except EmotionDetectionError as e:
+            outcomes[index] = {'ok': False, 'payload': e.payload, 'status': e.status, 'wait_ms': wait_ms}
+            continue
+        faces.append((index, face, details))
+        outcomes[index] = {'ok': True, 'wait_ms': wait_ms}
+
+    if faces:
+        start = time.perf_counter()
+        scores = classify_faces([face for _, face, _ in faces])
+        classify_ms = _ms_since(start)
+        for (index, _, details), face_scores in zip(faces, scores):
+            outcomes[index]['payload'] = finish_response(face_scores, details, classify_ms)
+    return outcomes
+
+
+class MicroBatcher:
+    """Groups items submitted from many threads into batches for one handler call
+
+    The first waiting item opens a window of max_wait_ms; the batch goes to
+    handler(items) -> results (one per item, in order) when the window closes or
+    max_batch items are waiting. At most concurrency batches run at once; while they
+    are busy, new items keep collecting, so batches grow with load.
+    """
+
+    def __init__(self, handler, max_batch=8, max_wait_ms=10, concurrency=1, name='batcher'):
+        self.handler = handler
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._cond = threading.Condition()
+        self._queue = deque()  # (item, future, submitted_at)
+        self._slots = threading.Semaphore(concurrency)
+        self._executor = ThreadPoolExecutor(concurrency, thread_name_prefix=name)
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+        self.total_wait_ms = 0.0
+        threading.Thread(target=self._collect, name=name, daemon=True).start()
+
+    def submit(self, item):
+        """Queue an item; the returned Future resolves to its result"""
+        future = Future()
+        with self._cond:
+            self._queue.append((item, future, time.perf_counter()))
+            self._cond.notify()
+        return future
+
+    def _collect(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue)
+            self._slots.acquire()
+            with self._cond:
+                deadline = self._queue[0][2] + self.max_wait
+                while len(self._queue) < self.max_batch:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = [self._queue.popleft() for _ in range(min(self.max_batch, len(self._queue)))]
+            self._executor.submit(self._run, batch)
+
+    def _run(self, batch):
+        try:
+            now = time.perf_counter()
+            self.batches += 1
+            self.items += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            self.total_wait_ms += sum(now - submitted_at for _, _, submitted_at in batch) * 1000
+            try:
+                results = self.handler([item for item, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                return
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+        finally:
+            self._slots.release()
+
+    def stats(self):
+        return {
+            'max_batch': self.max_batch,
+            'max_wait_ms': round(self.max_wait * 1000, 1),
+            'batches': self.batches,
+            'items': self.items,
+            'avg_batch': round(self.items / self.batches, 2) if self.batches else None,
+            'largest_batch': self.largest_batch,
+            'avg_wait_ms': round(self.total_wait_ms / self.items, 2) if self.items else None
+        }
+
+
+class EmotionOverloadedError(EmotionDetectionError):
+    """Every worker is busy and the queue is full"""
+
+    def __init__(self, retry_after=1):
+        super().__init__({
+            'error': 'Emotion detection is busy',
+            'details': 'Too many frames are waiting, please retry shortly.'
+        }, status=503)
+        self.headers = {'Retry-After': str(retry_after)}
+
+
+class EmotionWorkerPool:
+    """Dedicated process pool for emotion inference behind a bounded queue
+
+    Keeps CPU-heavy inference off the Flask request threads. At most workers + queue_size
+    frames are admitted at once; anything beyond that is rejected immediately
+    (EmotionOverloadedError -> 503) instead of queueing up latency. A frame holds its slot
+    until the pool has finished it, even when the request gave up waiting (504).
+    """
+
+    def __init__(self, workers=1, queue_size=4, timeout=30.0, batch_max=1, batch_wait_ms=10):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self.in_flight = 0
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.failed = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self._executor = None
+        self._start()
+        # With batching, frames arriving together go to a worker as one task that runs a
+        # single emotion model pass over all their faces
+        self._batcher = MicroBatcher(self._run_batch, batch_max, batch_wait_ms, concurrency=workers,
+                                     name='emotion-batch') if batch_max > 1 else None
+
+    def _start(self, method=None):
+        # fork: the first pool starts before any request thread exists and its workers inherit
+        # the loaded modules; spawn elsewhere (Windows)
+        method = method or ('fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn')
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context(method),
+            initializer=_pool_worker_init
+        )
+        # The first task completes once a worker has finished warming up
+        self._executor.submit(_pool_ping).add_done_callback(self._on_ping)
+
+    def _on_ping(self, future):
+        try:
+            warmup_status.update(future.result())
+            if warmup_status['state'] == 'ready':
+                self._ready.set()
+        except Exception as e:
+            warmup_status.update({'state': 'failed', 'error': str(e)})
+
+    def is_ready(self):
+        return self._ready.is_set()
+
+    def _restart(self, executor):
+        with self._lock:
+            if self._executor is executor:  # first of the batch to notice restarts it
+                print("Emotion worker died, restarting the pool")
+                # Request, batcher and flush threads are running by now, and a fork could copy
+                # a lock one of them holds; replacement workers start from a fresh interpreter
+                methods = multiprocessing.get_all_start_methods()
+                self._start('forkserver' if 'forkserver' in methods else 'spawn')
+
+    def _release(self, count):
+        """Give back the admission slots of frames the pool is done with"""
+        with self._lock:
+            self.in_flight -= count
+        for _ in range(count):
+            self._slots.release()
+
+    def _run_batch(self, frames):
+        """Run frames as one pool task and wait for their outcomes"""
+        executor = self._executor
+        try:
+            future = executor.submit(_pool_detect_batch, frames)
+        except BaseException as e:
+            self._release(len(frames))
+            if isinstance(e, BrokenProcessPool):
+                self._restart(executor)
+            raise
+        # Released when the task finishes, not when a caller stops waiting for it
+        future.add_done_callback(lambda _: self._release(len(frames)))
+        try:
+            return future.result(timeout=self.timeout)
+        except BrokenProcessPool:
+            self._restart(executor)
+            raise
+
+    def detect(self, img_bytes):
+        """Run the pipeline for one frame in the pool; raises EmotionOverloadedError when full"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise EmotionOverloadedError()
+
+        with self._lock:
+            self.in_flight += 1
+            self.submitted += 1
+        # The slot is given back by _run_batch once the pool has finished the frame
+        frame = (img_bytes, cascade.plan(), cascade.latencies(), TIME_BUDGET_MS, time.time())
+        try:
+            if self._batcher is not None:
+                outcome = self._batcher.submit(frame).result(timeout=self.timeout + self._batcher.max_wait)
+            else:
+                outcome = self._run_batch([frame])[0]
+        except FutureTimeoutError:
+            with self._lock:
+                self.failed += 1
+            raise EmotionDetectionError({'error': 'Emotion detection timed out'}, status=504)
+        except BrokenProcessPool:
+            with self._lock:
+                self.failed += 1
+            raise
+
+        payload = outcome['payload']
+        _record(payload)
+        with self._lock:
+            self.completed += 1
+            self.total_wait_ms += outcome['wait_ms']
+            self.max_wait_ms = max(self.max_wait_ms, outcome['wait_ms'])
+        if not outcome['ok']:
+            raise EmotionDetectionError(payload, outcome['status'])
+        return payload
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'queue_size': self.queue_size,
+                'in_flight': self.in_flight,
+                'queue_depth': max(0, self.in_flight - self.workers),
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'failed': self.failed,
+                'avg_wait_ms': round(self.total_wait_ms / self.completed, 1) if self.completed else None,
+                'max_wait_ms': self.max_wait_ms
+            }
+
+
+# Set by start() when inference runs in a worker pool
+_pool = None
+# Set by start() when inference runs inline with batching on: request threads detect faces
+# in parallel and hand the crops to this batcher for the emotion model
+_classify_batcher = None
+
+
+def start(workers=0, queue_size=4, warmup_mode='background', batch_max=None, batch_wait_ms=None):
+    """Start emotion detection for this process
+
+    With workers > 0 frames go to a dedicated process pool whose workers each hold the
+    models; otherwise they run inline on the request thread, warmed per warmup_mode.
+    batch_max > 1 turns on micro-batching of the emotion model (see MicroBatcher).
+    """
+    global _pool, _classify_batcher
+    batch_max = batch_max or BATCH_MAX
+    batch_wait_ms = BATCH_WAIT_MS if batch_wait_ms is None else batch_wait_ms
+    if workers > 0:
+        # A pool worker importing the app again must not start a pool of its own
+        if multiprocessing.parent_process() is None:
+            _pool = EmotionWorkerPool(workers, queue_size, batch_max=batch_max, batch_wait_ms=batch_wait_ms)
+    else:
+        if batch_max > 1:
+            _classify_batcher = MicroBatcher(classify_faces, batch_max, batch_wait_ms, name='emotion-batch')
+        start_warmup(warmup_mode)
+
+
+def pool_stats():
+    return _pool.stats() if _pool else None
+
+
+def batch_stats():
+    batcher = _pool._batcher if _pool else _classify_batcher
+    return batcher.stats() if batcher else None
+
+
+def cache_stats():
+    return result_cache.stats() if result_cache else None
+
+
+def _record(payload):
+    """Fold one frame's diagnostics (response or error payload) into the statistics"""
+    attempts = payload.get('attempts', [])
+    cascade.record(attempts, payload.get('detector'))
+    stage_timings.record(payload.get('timings'))
+    if not metrics.ENABLED:
+        return
+
+    for stage, ms in (payload.get('timings') or {}).items():
+        metrics.stage_seconds.observe(ms / 1000, 'emotion_' + stage.removesuffix('_ms'))
+    for attempt in attempts:
+        outcome = 'error' if attempt.get('error') else 'face' if attempt.get('face_found') else 'no_face'
+        metrics.detector_seconds.observe(attempt['ms'] / 1000, attempt['detector'], outcome)
+    if payload.get('success'):
+        if not any(attempt.get('face_found') for attempt in attempts):
+            metrics.fallbacks.inc('emotion_whole_frame')  # no detector found a face, classified the frame
+        if payload['confidence'] < MIN_CONFIDENCE:
+            metrics.fallbacks.inc('emotion_low_confidence')  # answered Calm
+
+
+def _detect(img_bytes):
+    if _pool is not None:
+        return _pool.detect(img_bytes)
+
+    try:
+        response = run_pipeline(img_bytes, cascade.plan(), TIME_BUDGET_MS)
+    except EmotionDetectionError as e:
+        _record(e.payload)
+        raise
+    _record(response)
+    return response
+
+
+def detect_emotion(img_bytes, session_id=None):
+    """Full pipeline for one encoded frame; raises EmotionDetectionError for client errors
+
+    With a session_id, a frame that looks like one the session sent moments ago gets the
+    earlier result back from the cache instead of running the models again.
+    """
+    if result_cache is None or session_id is None:
+        return _detect(img_bytes)
+
+    key = frame_hash(img_bytes)
+    if key is None:
+        return _detect(img_bytes)  # undecodable, let the pipeline report it
+    cached = result_cache.lookup(session_id, key)
+    if cached is not None:
+        return cached
+
+    response = _detect(img_bytes)
+    result_cache.store(session_id, key, {k: v for k, v in response.items() if k not in _UNCACHED_FIELDS})
+    return response
@@ -0,0 +1,272 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import emotion
+
+# Continuous camera mood tracking.
+#
+# Clients push frames as fast as they like; each session keeps only the newest one.
+# While someone listens to the session's event stream, a ticker thread takes the newest
+# frame once per tick, runs it through emotion.detect_emotion and folds the scores into an
+# exponential moving average. Frames that arrive between ticks replace each other unseen,
+# so the cost is at most one inference per tick per session whatever the client's frame rate.
+
+# Length prefix of each frame in a streamed upload (big-endian byte count, then the image)
+FRAME_HEADER_BYTES = 4
+
+
+class FrameStreamError(ValueError):
+    """A streamed upload is malformed (oversized or truncated frame)"""
+
+
+def read_frames(stream, max_frame_bytes):
+    """Yield length-prefixed frames from a file-like request body as they arrive"""
+    while True:
+        header = _read_exact(stream, FRAME_HEADER_BYTES)
+        if not header:
+            return
+        if len(header) < FRAME_HEADER_BYTES:
+            raise FrameStreamError('Truncated frame header')
+        size = int.from_bytes(header, 'big')
+        if size == 0 or size > max_frame_bytes:
+            raise FrameStreamError(f'Frame size {size} outside 1..{max_frame_bytes} bytes')
+        frame = _read_exact(stream, size)
+        if len(frame) < size:
+            raise FrameStreamError('Truncated frame')
+        yield frame
+
+
+def _read_exact(stream, size):
+    # Chunked bodies hand out whatever has arrived, so keep reading until size bytes or EOF
+    data = stream.read(size)
+    if not data or len(data) == size:
+        return data
+    parts = [data]
+    remaining = size - len(data)
+    while remaining:
+        chunk = stream.read(remaining)
+        if not chunk:
+            break
+        parts.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(parts)
+
+
+class EmotionStream:
+    """Newest-frame slot, smoothed emotion scores and ticker for one camera session"""
+
+    def __init__(self, session_id, detect, tick_seconds=0.5, alpha=0.3):
+        self.session_id = session_id
+        self.detect = detect
+        self.tick_seconds = tick_seconds
+        self.alpha = alpha
+        self.cond = threading.Condition()
+        self.frame = None
+        self.scores = None          # emotion -> smoothed percent
+        self.event = None           # (name, payload) last published
+        self.version = 0
+        self.listeners = 0
+        self.ticking = False
+        self.last_active = time.monotonic()
+        self.frames_received = 0
+        self.frames_dropped = 0
+        self.inferences = 0
+        self.errors = 0
+
+    def push(self, frame):
+        """Replace the pending frame; an unprocessed older one is dropped"""
+        with self.cond:
+            if self.frame is not None:
+                self.frames_dropped += 1
+            self.frame = frame
+            self.frames_received += 1
+            self.last_active = time.monotonic()
+
+    def _publish(self, name, payload):
+        with self.cond:
+            self.version += 1
+            self.event = (name, payload)
+            self.cond.notify_all()
+
+    def _fold(self, result):
+        """Blend one frame's scores into the moving average and build the mood event"""
+        raw = result.get('all_emotions', {})
+        if self.scores is None:
+            self.scores = dict(raw)
+        else:
+            for key in set(self.scores) | set(raw):
+                previous = self.scores.get(key, 0.0)
+                self.scores[key] = self.alpha * raw.get(key, 0.0) + (1 - self.alpha) * previous
+
+        dominant_emotion = max(self.scores, key=self.scores.get) if self.scores else 'neutral'
+        confidence = self.scores.get(dominant_emotion, 0.0)
+        detected_mood = emotion.EMOTION_TO_MOOD.get(dominant_emotion, 'Happy')
+        if confidence < emotion.MIN_CONFIDENCE:
+            detected_mood = 'Calm'
+            dominant_emotion = 'neutral'
+
+        return {
+            'session_id': self.session_id,
+            'detected_mood': detected_mood,
+            'dominant_emotion': dominant_emotion,
+            'confidence': round(confidence, 2),
+            'all_emotions': {k: round(v, 2) for k, v in self.scores.items()},
+            'frame_emotion': result.get('dominant_emotion'),
+            'frames_received': self.frames_received,
+            'frames_dropped': self.frames_dropped,
+            'inferences': self.inferences
+        }
+
+    def _tick_loop(self):
+        next_tick = time.monotonic()
+        while True:
+            with self.cond:
+                if self.listeners == 0:
+                    self.ticking = False
+                    return
+                frame, self.frame = self.frame, None
+
+            if frame is not None:
+                try:
+                    result = self.detect(frame, self.session_id)
+                    self.inferences += 1
+                    self._publish('mood', self._fold(result))
+                except emotion.EmotionOverloadedError:
+                    pass  # pool is full, the next tick takes whatever frame is newest then
+                except emotion.EmotionDetectionError as e:
+                    self.errors += 1
+                    self._publish('error', {k: v for k, v in e.payload.items() if k not in ('attempts', 'timings')})
+                except Exception as e:
+                    self.errors += 1
+                    print(f"Emotion stream {self.session_id} failed: {e}")
+                    self._publish('error', {'error': str(e)})
+
+            # Fixed rate: an inference that overran the tick starts the next one right away
+            # instead of bursting to catch up
+            next_tick += self.tick_seconds
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.monotonic()
+
+    def events(self, keepalive_seconds=15.0):
+        """Server-sent events for this session; the ticker runs while anyone listens"""
+        with self.cond:
+            self.listeners += 1
+            self.last_active = time.monotonic()
+            if not self.ticking:
+                self.ticking = True
+                threading.Thread(target=self._tick_loop, name=f'emotion-stream-{self.session_id}',
+                                 daemon=True).start()
+            seen = self.version
+        try:
+            yield f'retry: {int(self.tick_seconds * 1000)}\n\n'
+            while True:
+                with self.cond:
+                    self.cond.wait_for(lambda: self.version != seen, timeout=keepalive_seconds)
+                    if self.version == seen:
+                        event = None
+                    else:
+                        seen = self.version
+                        event = self.event
+                    self.last_active = time.monotonic()
+                if event is None:
+                    yield ': keepalive\n\n'  # also how a closed connection is noticed
+                else:
+                    name, payload = event
+                    yield f'event: {name}\ndata: {json.dumps(payload)}\n\n'
+        finally:
+            with self.cond:
+                self.listeners -= 1
+                self.last_active = time.monotonic()
+
+    def stats(self):
+        with self.cond:
+            return {
+                'listeners': self.listeners,
+                'frames_received': self.frames_received,
+                'frames_dropped': self.frames_dropped,
+                'inferences': self.inferences,
+                'errors': self.errors
+            }
+
+
+class EmotionStreamHub:
+    """Per-session emotion streams, dropping ones that went idle
+
+    Event streams and streamed uploads hold a server thread for as long as they stay open,
+    so at most max_connections of them are admitted at once (see open_connection()).
+    """
+
+    def __init__(self, detect, tick_seconds=0.5, alpha=0.3, max_streams=200, idle_seconds=60,
+                 max_connections=32):
+        self.detect = detect
+        self.tick_seconds = tick_seconds
+        self.alpha = alpha
+        self.max_streams = max_streams
+        self.idle_seconds = idle_seconds
+        self.max_connections = max_connections
+        self._lock = threading.Lock()
+        self._streams = OrderedDict()  # session_id -> EmotionStream, least recently used first
+        self.expired = 0
+        self.connections = 0
+        self.rejected_connections = 0
+
+    def _expire(self, now):
+        """Drop streams without listeners that saw no frame for idle_seconds (caller holds the lock)"""
+        for session_id, stream in list(self._streams.items()):
+            if stream.listeners == 0 and now - stream.last_active > self.idle_seconds:
+                del self._streams[session_id]
+                self.expired += 1
+
+    def get(self, session_id):
+        """Get or create the stream for a session (None when max_streams are active)"""
+        session_id = str(session_id)
+        with self._lock:
+            stream = self._streams.get(session_id)
+            if stream is None:
+                self._expire(time.monotonic())
+                if len(self._streams) >= self.max_streams:
+                    return None
+                stream = self._streams[session_id] = EmotionStream(
+                    session_id, self.detect, self.tick_seconds, self.alpha)
+            self._streams.move_to_end(session_id)
+            return stream
+
+    def open_connection(self):
+        """Admit one long-lived connection; False when max_connections are already open"""
+        with self._lock:
+            if self.connections >= self.max_connections:
+                self.rejected_connections += 1
+                return False
+            self.connections += 1
+            return True
+
+    def close_connection(self):
+        with self._lock:
+            self.connections -= 1
+
+    def stats(self):
+        with self._lock:
+            streams = list(self._streams.values())
+            connections = self.connections
+        totals = {'frames_received': 0, 'frames_dropped': 0, 'inferences': 0}
+        listening = 0
+        for stream in streams:
+            stream_stats = stream.stats()
+            listening += stream_stats['listeners'] > 0
+            for key in totals:
+                totals[key] += stream_stats[key]
+        return {
+            'streams': len(streams),
+            'listening': listening,
+            'expired': self.expired,
+            'connections': connections,
+            'max_connections': self.max_connections,
+            'rejected_connections': self.rejected_connections,
+            'tick_ms': round(self.tick_seconds * 1000),
+            **totals
+        }
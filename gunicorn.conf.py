@@ -0,0 +1,43 @@
+import gc
+import os
+
+# Pre-fork serving: gunicorn -c gunicorn.conf.py app:app
+#
+# The app (catalog, rankings, pre-encoded JSON) is imported once in the master and the
+# workers are forked from it, so they share those pages copy-on-write instead of each
+# loading its own copy. Pages stay shared only while nothing writes to them: the serving
+# structures keep their per-track data in NumPy arrays and flat strings, and the master's
+# objects are frozen out of the garbage collector, whose bookkeeping would otherwise write
+# to every object it scans. Emotion inference and the catalog watcher start per worker.
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = 60
+
+# Emotion event streams and streamed frame uploads keep a thread each for as long as they
+# are open; cap them at half of a worker's threads so the rest always serve other routes
+os.environ.setdefault('EMOTION_STREAM_MAX_CONNECTIONS', str(max(1, threads // 2)))
+
+# GUNICORN_PRELOAD=0 loads the app in every worker instead (for comparison)
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'True').lower() in ('1', 'true', 'yes')
+
+if preload_app:
+    os.environ['PRELOAD_APP'] = '1'
+    # No collections in the master while the catalog is built; the workers turn it back on
+    gc.disable()
+
+
+def pre_fork(server, worker):
+    if server.cfg.preload_app:
+        # Everything the master holds moves to the permanent generation, which the
+        # workers' collections never scan
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        gc.enable()
+        import app
+        app.start_services()
@@ -0,0 +1,133 @@
+import bisect
+import os
+import threading
+import time
+from functools import wraps
+
+# Prometheus metrics for this process, served at /metrics.
+#
+# METRICS_ENABLED=0 turns instrumentation off: timed() then hands functions back unwrapped
+# and observe()/inc() return before doing anything, so a disabled stage costs one function
+# call at most. Each process keeps its own numbers (scrape every worker, or run one).
+
+ENABLED = os.environ.get('METRICS_ENABLED', 'True').lower() in ('1', 'true', 'yes')
+
+# Upper bounds in seconds; finer than Prometheus' defaults at the low end because most
+# in-process stages take well under a millisecond
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """Monotonic count per label values"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}  # label values -> count
+
+    def inc(self, *labels, amount=1):
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append(f'{self.name}{_labels(self.labelnames, labels)} {value}')
+        return lines
+
+
+class Histogram:
+    """Bucketed observations (count and sum too) per label values"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}  # label values -> [per-bucket counts (last is +Inf), sum]
+
+    def observe(self, value, *labels):
+        if not ENABLED:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((labels, list(counts), total) for labels, (counts, total) in self._series.items())
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (None,), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound is None else f'le="{bound:g}"'
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {total:.6f}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {cumulative}')
+        return lines
+
+
+request_seconds = Histogram(
+    'http_request_duration_seconds', 'Time to handle a request, by route pattern',
+    ('route', 'method', 'status'))
+http_errors = Counter(
+    'http_errors_total', 'Responses with a 4xx or 5xx status, by route pattern',
+    ('route', 'status'))
+stage_seconds = Histogram(
+    'stage_duration_seconds', 'Time spent in one internal stage of a request', ('stage',))
+detector_seconds = Histogram(
+    'emotion_detector_attempt_duration_seconds', 'Time of one face detector attempt, by outcome',
+    ('detector', 'outcome'))
+fallbacks = Counter(
+    'fallbacks_total', 'Requests answered through a fallback path', ('kind',))
+
+REGISTRY = (request_seconds, http_errors, stage_seconds, detector_seconds, fallbacks)
+
+
+def timed(stage):
+    """Decorator recording each call's duration under stage (the function itself when disabled)"""
+    def decorate(func):
+        if not ENABLED:
+            return func
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stage_seconds.observe(time.perf_counter() - start, stage)
+        return wrapper
+    return decorate
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,511 @@
+import hashlib
+import json
+import re
+import time
+from datetime import datetime
+
+import numpy as np
+
+import metrics
+from catalog import catalog_version, load_catalog
+
+# Mood/language detection and popularity-ranked recommendations over a tracks table.
+# Kept apart from app.py so offline tools (classify_chats.py, benchmarks) can build a
+# recommender without starting the web app's sessions, emotion workers and watchers.
+
+def _trie_pattern(words):
+    """Build a regex alternation for words, factored into a character trie"""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True  # end of word marker
+    
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # Optional tail when a shorter word ends here; greedy, so the longest word is tried first
+        return '(?:' + body + ')?' if '' in node else body
+    
+    return build(trie)
+
+# Distinct romanized keywords a message needs before it counts as that language; one
+# word alone is too often English ('hai guys') or a name
+MIN_ROMANIZED_KEYWORDS = 2
+
+# Tracks pre-encoded per (mood, language) ranking when a catalog loads; the rest on first use
+PRELOADED_FRAGMENTS = 100
+
+class JSONFragments(list):
+    """Already-encoded JSON values that encode_json() emits as an array without re-encoding"""
+
+def encode_json(value):
+    """Compact, key-sorted JSON (as jsonify writes it) with JSONFragments spliced in as-is"""
+    if isinstance(value, JSONFragments):
+        return '[' + ','.join(value) + ']'
+    if isinstance(value, dict):
+        return '{' + ','.join(json.dumps(str(k)) + ':' + encode_json(v) for k, v in sorted(value.items())) + '}'
+    if isinstance(value, (list, tuple)):
+        return '[' + ','.join(encode_json(v) for v in value) + ']'
+    return json.dumps(value)
+
+class MoodBasedRecommender:
+    def __init__(self, tracks_df, catalog_version=None):
+        self.tracks_df = tracks_df
+        self.catalog_version = catalog_version
+        
+        # Language detection patterns: native script block and romanized keywords
+        self.language_patterns = {
+            'Hindi': {
+                'script': (0x0900, 0x097F),  # Devanagari script
+                'keywords': ['hai', 'hain', 'kya', 'kaise', 'mujhe', 'tera', 'tere', 'bahut', 'accha',
+                             'bura', 'khush', 'udaas', 'dukhi', 'pyaar', 'mohabbat', 'dost', 'yaar', 'bhai',
+                             'didi', 'ghar', 'kaam', 'padhai', 'gaana']
+            },
+            'Telugu': {
+                'script': (0x0C00, 0x0C7F),  # Telugu script
+                'keywords': ['nenu', 'naaku', 'meeku', 'ela', 'enti', 'bagundi', 'ledhu', 'kavali', 'anthe']
+            },
+            'Tamil': {
+                'script': (0x0B80, 0x0BFF),  # Tamil script
+                'keywords': ['naan', 'enakku', 'unakku', 'epdi', 'enna', 'nalla', 'illa', 'venum']
+            },
+            'Malayalam': {
+                'script': (0x0D00, 0x0D7F),  # Malayalam script
+                'keywords': ['njan', 'enikku', 'ningalkku', 'engane', 'enthu', 'nannaayi', 'illa', 'venam',
+                             'sheriyaanu']
+            },
+            'Kannada': {
+                'script': (0x0C80, 0x0CFF),  # Kannada script
+                'keywords': ['naanu', 'nanage', 'nimage', 'hege', 'yenu', 'chennagide', 'illa', 'beku']
+            }
+        }
+        
+        # Mood detection keywords (English + Hinglish)
+        self.mood_keywords = {
+            'Happy': [
+                'happy', 'joy', 'excited', 'great', 'awesome', 'wonderful', 'amazing', 'fantastic',
+                'khush', 'mast', 'mazaa', 'maja', 'party', 'celebrate', 'celebration', 'fun',
+                'cheerful', 'delighted', 'pleased', 'glad', 'joyful', 'ecstatic', 'blessed'
+            ],
+            'Sad': [
+                'sad', 'unhappy', 'depressed', 'down', 'upset', 'hurt', 'pain', 'crying',
+                'udaas', 'dukhi', 'dard', 'rona', 'breakup', 'heartbreak', 'lonely', 'alone',
+                'miss', 'missing', 'cry', 'tears', 'lost', 'broken', 'disappointed'
+            ],
+            'Energetic': [
+                'energy', 'energetic', 'pump', 'workout', 'gym', 'exercise', 'run', 'active',
+                'power', 'strong', 'intense', 'adrenaline', 'beast mode', 'fired up',
+                'josh', 'full energy', 'workout karna hai', 'gym jaana', 'dance', 'jumping'
+            ],
+            'Calm': [
+                'calm', 'peace', 'peaceful', 'relax', 'relaxed', 'chill', 'meditation', 'quiet',
+                'shanti', 'aram', 'rest', 'sleep', 'soothing', 'gentle', 'soft', 'tranquil',
+                'serene', 'peaceful', 'stress free', 'tension free', 'breathe'
+            ],
+            'Romantic': [
+                'love', 'romance', 'romantic', 'crush', 'date', 'valentine', 'heart', 'lover',
+                'pyaar', 'mohabbat', 'ishq', 'dil', 'girlfriend', 'boyfriend', 'propose',
+                'kiss', 'hug', 'baby', 'sweetheart', 'darling', 'beautiful', 'handsome'
+            ],
+            'Motivated': [
+                'motivated', 'motivation', 'inspire', 'success', 'goal', 'achieve', 'hustle',
+                'grind', 'focus', 'determination', 'dream', 'ambition', 'winner', 'champion',
+                'improve', 'better', 'growth', 'progress', 'never give up', 'keep going'
+            ],
+            'Party': [
+                'party', 'club', 'dance', 'dj', 'drinks', 'night out', 'clubbing', 'vibes',
+                'lit', 'turn up', 'bass', 'edm', 'beat', 'drop', 'festival', 'rave',
+                'friends', 'gang', 'wild', 'crazy night', 'dance floor', 'nightlife'
+            ],
+            'Focus': [
+                'study', 'work', 'focus', 'concentrate', 'concentration', 'exam', 'office',
+                'productive', 'productivity', 'reading', 'coding', 'assignment', 'project',
+                'deadline', 'padhai', 'kaam', 'working', 'studying', 'learn', 'learning'
+            ]
+        }
+        
+        # Phrases that continue the previous mood when no mood keyword matches
+        self.continuation_phrases = ['yes', 'yeah', 'yep', 'ha', 'haan', 'more', 'another',
+                                     'similar', 'like that', 'same', 'continue', 'and', 'also']
+        
+        # Compile keyword lists into single word-bounded patterns
+        self._compile_mood_matcher()
+        self._compile_language_detector()
+        
+        # Popularity-ranked row positions per (mood, language) and per mood
+        self._build_popularity_index()
+        
+        # Facet counts and stats never change for a loaded catalog
+        self._build_stats()
+    
+    def _compile_mood_matcher(self):
+        """Compile all mood keywords into one regex so a message is scanned once"""
+        # Moods each keyword counts towards (a keyword listed twice counts twice, as before)
+        self._keyword_moods = {}
+        for mood, keywords in self.mood_keywords.items():
+            for keyword in keywords:
+                self._keyword_moods.setdefault(keyword, []).append(mood)
+        
+        # Keywords are merged into a character trie so the regex engine branches per character
+        # instead of trying every alternative; the lookahead finds the longest keyword starting
+        # at every word, so overlapping phrases ('crazy night' / 'night out') all match
+        keywords = sorted(self._keyword_moods, key=len, reverse=True)
+        self._mood_pattern = re.compile(r'\b(?=(' + _trie_pattern(keywords) + r')\b)')
+        
+        # A phrase also contains shorter keywords ('dance floor' -> 'dance'); credit those too
+        self._keyword_contains = {}
+        for phrase in keywords:
+            self._keyword_contains[phrase] = [
+                keyword for keyword in keywords
+                if re.search(r'\b' + re.escape(keyword) + r'\b', phrase)
+            ]
+        
+        self._continuation_pattern = re.compile(
+            r'\b(?:' + '|'.join(re.escape(p) for p in sorted(self.continuation_phrases, key=len, reverse=True)) + r')\b'
+        )
+    
+    def _compile_language_detector(self):
+        """Precompute the script range table and romanized keyword lookup for language detection"""
+        # Indic script blocks are 128 code points wide and 128-aligned, so code point >> 7
+        # indexes straight into the table
+        self._script_blocks = {}
+        for language, patterns in self.language_patterns.items():
+            start, end = patterns['script']
+            for block in range(start >> 7, (end >> 7) + 1):
+                self._script_blocks[block] = language
+        
+        # Romanized word -> languages it points to ('illa' is shared by several)
+        self._romanized_keywords = {}
+        for language, patterns in self.language_patterns.items():
+            for keyword in patterns['keywords']:
+                self._romanized_keywords.setdefault(keyword, []).append(language)
+        
+        self._word_pattern = re.compile(r'\w+')
+    
+    def detect_native_language(self, text):
+        """Detect language from native script characters, falling back to romanized keywords"""
+        language_scores = {}
+        
+        # Single pass over code points; pure ASCII text has no native script to find
+        if not text.isascii():
+            script_blocks = self._script_blocks
+            for char in text:
+                language = script_blocks.get(ord(char) >> 7)
+                if language:
+                    language_scores[language] = language_scores.get(language, 0) + 1
+        
+        # Romanized keywords only when no native script was found
+        if not language_scores:
+            for word in set(self._word_pattern.findall(text.lower())):
+                for language in self._romanized_keywords.get(word, ()):
+                    language_scores[language] = language_scores.get(language, 0) + 1
+            language_scores = {language: score for language, score in language_scores.items()
+                               if score >= MIN_ROMANIZED_KEYWORDS}
+        
+        if not language_scores:
+            return None
+        
+        best_score = max(language_scores.values())
+        best_languages = [language for language, score in language_scores.items() if score == best_score]
+        
+        # Ambiguous when shared words ('illa') tie between languages
+        if len(best_languages) > 1:
+            return None
+        return best_languages[0]
+    
+    def count_mood_keywords(self, text):
+        """Scan text once and return the number of distinct keyword hits per mood"""
+        matched = set()
+        for match in self._mood_pattern.finditer(text.lower()):
+            matched.update(self._keyword_contains[match.group(1)])
+        
+        mood_scores = dict.fromkeys(self.mood_keywords, 0)
+        for keyword in matched:
+            for mood in self._keyword_moods[keyword]:
+                mood_scores[mood] += 1
+        return mood_scores
+    
+    def _build_popularity_index(self):
+        """Pre-sort track positions by popularity for every (mood, language) pair and every mood"""
+        # Stable sort keeps file order for equal popularity, same as nlargest(keep='first')
+        # (widened before negating, popularity may be stored unsigned)
+        order = np.argsort(-self.tracks_df['popularity'].to_numpy().astype(np.int64), kind='stable')
+        ranked_df = self.tracks_df.iloc[order]
+        
+        self._ranked_positions = {}
+        for (mood, language), positions in ranked_df.groupby(['mood', 'language'], sort=False, observed=True).indices.items():
+            self._ranked_positions[(mood, language)] = order[positions]
+        for mood, positions in ranked_df.groupby('mood', sort=False, observed=True).indices.items():
+            # language=None holds the ranking across all languages
+            self._ranked_positions[(mood, None)] = order[positions]
+        
+        # Columns served to clients, projected once. Track ids are a fixed-width string
+        # array rather than Python objects, so reading them never writes a refcount into
+        # pages shared with pre-forked workers.
+        self._track_records = self.tracks_df[['id', 'name', 'artist', 'album', 'popularity', 'language']]
+        self._track_ids = self.tracks_df['id'].to_numpy().astype(str)
+        
+        # Each ranking's top tracks as JSON objects, encoded once and stored back to back in
+        # one str per ranking with their offsets in a NumPy array (same reason as above)
+        self._ranked_fragments = {}
+        for key, positions in self._ranked_positions.items():
+            fragments = self._encode_tracks(positions[:PRELOADED_FRAGMENTS])
+            offsets = np.cumsum([0] + [len(fragment) for fragment in fragments], dtype=np.int64)
+            self._ranked_fragments[key] = (''.join(fragments), offsets)
+        # Tracks further down a ranking, encoded on first use (position -> str)
+        self._track_fragments = {}
+    
+    def _encode_tracks(self, positions):
+        """JSON objects for the tracks at positions, as jsonify would write them"""
+        records = self._track_records.iloc[positions].to_dict('records')
+        return [json.dumps(record, sort_keys=True, separators=(',', ':')) for record in records]
+    
+    def _ranked_records(self, key, n_recommendations):
+        """Records for the top N tracks of a (mood, language) ranking"""
+        positions = self._ranked_positions[key][:max(n_recommendations, 0)]
+        return self._track_records.iloc[positions].to_dict('records')
+    
+    def _ranked_json(self, key, n_recommendations):
+        """Pre-encoded JSON objects for the top N tracks of a (mood, language) ranking"""
+        positions = self._ranked_positions[key][:max(n_recommendations, 0)]
+        text, offsets = self._ranked_fragments[key]
+        bounds = offsets[:len(positions) + 1].tolist()
+        result = JSONFragments(text[start:end] for start, end in zip(bounds, bounds[1:]))
+        
+        if len(positions) > len(result):
+            tail = positions[len(result):].tolist()
+            fragments = self._track_fragments
+            missing = [position for position in tail if position not in fragments]
+            if missing:
+                fragments.update(zip(missing, self._encode_tracks(missing)))
+            result.extend(fragments[position] for position in tail)
+        return result
+    
+    def _ranking_key(self, mood, language=None):
+        """Key into the rankings for a mood and optional language ('All' or empty for every language)"""
+        if not language or language == 'All':
+            language = None
+        return (mood, language)
+    
+    def _get_ranked_positions(self, mood, language=None):
+        """Row positions for a mood (and optional language), most popular first"""
+        return self._ranked_positions.get(self._ranking_key(mood, language))
+    
+    # /chat times the two detectors as its own stages. classify_message (bulk classification)
+    # is timed once per message under its own label and calls the unwrapped helpers, so
+    # offline jobs do not skew the /chat stage histograms.
+    
+    @metrics.timed('detect_language_preference_from_text')
+    def detect_language_preference_from_text(self, text):
+        """Detect language preference from conversation (e.g., 'hindi songs', 'tamil music', or native script)"""
+        return self._detect_language(text)
+    
+    @metrics.timed('detect_mood_from_text')
+    def detect_mood_from_text(self, text, conversation_context=None):
+        """Detect mood from user message using keyword matching with context"""
+        return self._detect_mood(text, conversation_context)
+    
+    @metrics.timed('classify_message')
+    def classify_message(self, text):
+        """Detect mood and language for a single message without conversation context"""
+        return {
+            'detected_mood': self._detect_mood(text),
+            'detected_language': self._detect_language(text)
+        }
+    
+    def _detect_language(self, text):
+        text_lower = text.lower()
+        
+        # Check for explicit language mentions in English
+        language_mentions = {
+            'Hindi': ['hindi', 'bollywood', 'hindustani'],
+            'Telugu': ['telugu', 'tollywood'],
+            'Tamil': ['tamil', 'kollywood'],
+            'Malayalam': ['malayalam', 'mollywood'],
+            'Kannada': ['kannada', 'sandalwood'],
+            'English': ['english', 'western', 'international']
+        }
+        
+        for language, keywords in language_mentions.items():
+            for keyword in keywords:
+                if keyword in text_lower:
+                    return language
+        
+        # Otherwise use the script or romanized words the message is written in
+        # (None if nothing matched, will use All)
+        return self.detect_native_language(text)
+    
+    def _detect_mood(self, text, conversation_context=None):
+        text_lower = text.lower()
+        
+        # If there's conversation context, consider previous mood
+        previous_mood = None
+        if conversation_context and len(conversation_context) > 0:
+            last_exchange = conversation_context[-1]
+            previous_mood = last_exchange.get('detected_mood')
+        
+        # Count keyword matches for each mood in a single pass
+        mood_scores = self.count_mood_keywords(text_lower)
+        
+        # Boost score if it's a continuation of previous mood
+        if previous_mood in mood_scores and mood_scores[previous_mood] == 0:
+            # Check for continuation phrases
+            if self._continuation_pattern.search(text_lower):
+                mood_scores[previous_mood] += 2  # Boost previous mood
+        
+        # Get mood with highest score
+        if max(mood_scores.values()) > 0:
+            detected_mood = max(mood_scores, key=mood_scores.get)
+            return detected_mood
+        
+        # If no keywords matched, use previous mood if available
+        if previous_mood:
+            metrics.fallbacks.inc('mood_from_context')
+            return previous_mood
+        
+        # Default to Happy if no keywords matched
+        metrics.fallbacks.inc('mood_default')
+        return 'Happy'
+    
+    # The lookup behind /recommend (recommend_json) and /chat (recommend_with_playlist) is
+    # timed as the recommend_by_mood_and_language stage whichever form it returns.
+    # /recommend/batch is timed once per batch as recommend_batch; the lookups inside it
+    # use the unwrapped helpers so nothing is counted twice.
+    
+    @metrics.timed('recommend_by_mood_and_language')
+    def recommend_by_mood_and_language(self, mood, language=None, n_recommendations=10):
+        """Get top recommendations for a specific mood and optional language"""
+        key = self._ranking_key(mood, language)
+        positions = self._ranked_positions.get(key)
+        
+        if positions is None or len(positions) == 0:
+            return None
+        
+        # Index is already sorted by popularity, so top N is a slice
+        return self._ranked_records(key, n_recommendations)
+    
+    @metrics.timed('recommend_by_mood_and_language')
+    def recommend_json(self, mood, language=None, n_recommendations=10):
+        """Same as recommend_by_mood_and_language, as pre-encoded JSON objects (JSONFragments)"""
+        key = self._ranking_key(mood, language)
+        positions = self._ranked_positions.get(key)
+        
+        if positions is None or len(positions) == 0:
+            return None
+        
+        return self._ranked_json(key, n_recommendations)
+    
+    def get_all_tracks_for_mood_language(self, mood, language=None, limit=50):
+        """Get all track IDs for a mood-language combination (for creating playlists)"""
+        positions = self._get_ranked_positions(mood, language)
+        
+        if positions is None or len(positions) == 0:
+            return []
+        
+        # Get top tracks by popularity
+        return self._track_ids[positions[:max(limit, 0)]].tolist()
+    
+    @metrics.timed('recommend_batch')
+    def recommend_batch(self, queries, encoded=False):
+        """Get recommendations for many (mood, language, n_recommendations) queries at once
+        
+        Each (mood, language) slice is materialized once at the largest N asked for and
+        shared by every query on it. Returns results in query order, None where the slice
+        has no tracks (same as recommend_by_mood_and_language). With encoded=True each
+        result is JSONFragments, as from recommend_json.
+        """
+        largest_n = {}
+        for mood, language, n_recommendations in queries:
+            key = self._ranking_key(mood, language)
+            largest_n[key] = max(largest_n.get(key, 0), n_recommendations)
+        
+        lookup = self._ranked_json if encoded else self._ranked_records
+        slices = {}
+        for key, n_recommendations in largest_n.items():
+            positions = self._ranked_positions.get(key)
+            slices[key] = lookup(key, n_recommendations) if positions is not None and len(positions) else None
+        
+        results = []
+        for mood, language, n_recommendations in queries:
+            records = slices[self._ranking_key(mood, language)]
+            if records is not None:
+                records = records[:max(n_recommendations, 0)]
+                if encoded:
+                    records = JSONFragments(records)
+            results.append(records)
+        return results
+    
+    @metrics.timed('recommend_by_mood_and_language')
+    def recommend_with_playlist(self, mood, language=None, n_recommendations=10, playlist_limit=50, encoded=False):
+        """Get top N recommendations and playlist track IDs from a single ranked lookup
+        
+        Falls back to all languages when the requested language has no tracks for the mood.
+        Returns (recommendations, track_ids, language_used); recommendations are
+        JSONFragments with encoded=True.
+        """
+        language_used = language
+        key = self._ranking_key(mood, language)
+        positions = self._ranked_positions.get(key)
+        
+        if positions is None or len(positions) == 0:
+            # Fallback to 'All' languages if specific language has no tracks
+            language_used = 'All'
+            key = self._ranking_key(mood, 'All')
+            positions = self._ranked_positions.get(key)
+        
+        if positions is None or len(positions) == 0:
+            return (JSONFragments() if encoded else []), [], language_used
+        
+        if encoded:
+            recommendations = self._ranked_json(key, n_recommendations)
+        else:
+            recommendations = self._ranked_records(key, n_recommendations)
+        track_ids = self._track_ids[positions[:max(playlist_limit, 0)]].tolist()
+        return recommendations, track_ids, language_used
+    
+    def _build_stats(self):
+        """Compute facet counts and dataset statistics once per catalog"""
+        mood_counts = self.tracks_df['mood'].value_counts()
+        language_counts = self.tracks_df['language'].value_counts()
+        # Categorical columns also count categories with no rows
+        self._mood_counts = mood_counts[mood_counts > 0].to_dict()
+        self._language_counts = language_counts[language_counts > 0].to_dict()
+        
+        self._stats = {
+            'total_tracks': len(self.tracks_df),
+            'unique_artists': int(self.tracks_df['artist'].nunique()),
+            'unique_albums': int(self.tracks_df['album'].nunique()),
+            'avg_popularity': round(float(self.tracks_df['popularity'].mean()), 2) if len(self.tracks_df) else 0.0,
+            'languages': len(self._language_counts),
+            'moods': len(self._mood_counts)
+        }
+        # Serialized once for /stats, with an ETag for conditional GETs
+        self.stats_json = (json.dumps(self._stats, sort_keys=True, separators=(',', ':')) + '\n').encode('utf-8')
+        self.stats_etag = hashlib.sha1(self.stats_json).hexdigest()
+    
+    def get_available_moods(self):
+        """Get list of available moods with track counts"""
+        return dict(self._mood_counts)
+    
+    def get_available_languages(self):
+        """Get list of available languages with track counts"""
+        return dict(self._language_counts)
+    
+    def get_stats(self):
+        """Get dataset statistics"""
+        return dict(self._stats)
+
+def build_recommender(path):
+    """Load the catalog at path (CSV or its compiled form) and build a recommender with all its indexes"""
+    start = time.perf_counter()
+    version = catalog_version(path)
+    # Uses the compiled binary catalog when it is up to date (python catalog.py compile)
+    tracks_df = load_catalog(path)
+    new_recommender = MoodBasedRecommender(tracks_df, catalog_version=version)
+    new_recommender.loaded_at = datetime.now().isoformat()
+    new_recommender.load_seconds = round(time.perf_counter() - start, 3)
+    return new_recommender
@@ -0,0 +1,102 @@
+import gzip
+import threading
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """Ready-to-send JSON response bodies keyed by request parameters
+
+    Entries belong to the current catalog version, set by set_version() (or taken from the
+    first lookup). Moving to a new version drops everything; lookups and stores for any
+    other version, from requests still running on the old catalog, miss and are not kept,
+    so they cannot evict the new version's entries. Bodies (plus a gzip copy when compression is on and they are big
+    enough to benefit) count against max_bytes, and the least recently used entries are
+    evicted beyond it. Bodies larger than max_entry_bytes are never stored.
+    """
+
+    def __init__(self, max_bytes=16 * 1024 * 1024, max_entry_bytes=512 * 1024,
+                 compress=True, compress_min_bytes=1024):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.compress = compress
+        self.compress_min_bytes = compress_min_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (body, gzip body or None), oldest first
+        self._version = None
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale = 0
+
+    def set_version(self, version):
+        """Make version the current catalog version, dropping every entry if it changed"""
+        with self._lock:
+            if version != self._version:
+                if self._entries:
+                    self.invalidations += 1
+                self._entries.clear()
+                self.bytes = 0
+                self._version = version
+
+    def _is_current(self, version):
+        """Whether version is the current one, adopting it if none is set (caller holds the lock)"""
+        if self._version is None:
+            self._version = version
+        return version == self._version
+
+    def get(self, version, key):
+        """(body, gzip body or None) for a cached response, or None"""
+        with self._lock:
+            if not self._is_current(version):
+                self.stale += 1
+                return None
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, version, key, body):
+        """Store a response body; returns the (body, gzip body or None) entry"""
+        gzipped = None
+        if self.compress and len(body) >= self.compress_min_bytes:
+            gzipped = gzip.compress(body, compresslevel=6)
+        entry = (body, gzipped)
+        size = len(body) + (len(gzipped) if gzipped else 0)
+        if size > self.max_entry_bytes:
+            return entry
+
+        with self._lock:
+            if not self._is_current(version):
+                self.stale += 1
+                return entry
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= len(previous[0]) + (len(previous[1]) if previous[1] else 0)
+            self._entries[key] = entry
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (old_body, old_gzipped) = self._entries.popitem(last=False)
+                self.bytes -= len(old_body) + (len(old_gzipped) if old_gzipped else 0)
+                self.evictions += 1
+        return entry
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else None,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'stale': self.stale,
+                'compress': self.compress
+            }
@@ -0,0 +1,323 @@
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+
+class _Shard:
+    """One slice of the session store with its own lock and LRU order"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sessions = OrderedDict()  # session_id -> (last_access, history), oldest first
+        self.lru_evictions = 0
+        self.ttl_evictions = 0
+
+
+class SessionStore:
+    """Bounded in-memory conversation history with LRU eviction and an idle TTL
+
+    Sessions are spread over independently locked shards so concurrent requests for
+    different sessions don't contend on one lock. Each shard evicts its least recently
+    used session once it holds max_sessions / shards entries, so eviction order is LRU
+    per shard (close to global LRU when session ids hash evenly).
+    """
+
+    def __init__(self, max_sessions=10000, ttl_seconds=1800, max_history=10, shards=16):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_history = max_history
+        self._shards = [_Shard() for _ in range(shards)]
+        self._shard_capacity = max(1, -(-max_sessions // shards))  # ceil division
+
+    def _shard_for(self, session_id):
+        # crc32 is stable across processes, unlike hash() of a str
+        return self._shards[zlib.crc32(str(session_id).encode('utf-8')) % len(self._shards)]
+
+    def _expire(self, shard, now):
+        """Drop idle sessions from the front of the shard (caller holds the lock)"""
+        cutoff = now - self.ttl_seconds
+        while shard.sessions:
+            session_id, (last_access, _) = next(iter(shard.sessions.items()))
+            if last_access >= cutoff:
+                break
+            del shard.sessions[session_id]
+            shard.ttl_evictions += 1
+
+    def get(self, session_id):
+        """Get a copy of the conversation history for a session (empty if unknown or expired)"""
+        shard = self._shard_for(session_id)
+        now = time.monotonic()
+        with shard.lock:
+            self._expire(shard, now)
+            entry = shard.sessions.get(session_id)
+            if entry is None:
+                return []
+            shard.sessions[session_id] = (now, entry[1])
+            shard.sessions.move_to_end(session_id)
+            return list(entry[1])
+
+    def append(self, session_id, exchange):
+        """Append an exchange to a session, keeping only the last max_history entries"""
+        shard = self._shard_for(session_id)
+        now = time.monotonic()
+        with shard.lock:
+            self._expire(shard, now)
+            entry = shard.sessions.get(session_id)
+            history = entry[1] if entry else []
+            history.append(exchange)
+            if len(history) > self.max_history:
+                del history[:-self.max_history]
+            shard.sessions[session_id] = (now, history)
+            shard.sessions.move_to_end(session_id)
+
+            # Evict least recently used sessions once the shard is full
+            while len(shard.sessions) > self._shard_capacity:
+                shard.sessions.popitem(last=False)
+                shard.lru_evictions += 1
+
+    def clear(self, session_id):
+        """Forget a session"""
+        shard = self._shard_for(session_id)
+        with shard.lock:
+            shard.sessions.pop(session_id, None)
+
+    def __len__(self):
+        return sum(len(shard.sessions) for shard in self._shards)
+
+    def stats(self):
+        """Get session count and eviction counters"""
+        return {
+            'backend': 'memory',
+            'sessions': len(self),
+            'max_sessions': self.max_sessions,
+            'ttl_seconds': self.ttl_seconds,
+            'lru_evictions': sum(shard.lru_evictions for shard in self._shards),
+            'ttl_evictions': sum(shard.ttl_evictions for shard in self._shards)
+        }
+
+
+class SQLiteSessionStore:
+    """Conversation history in a SQLite (WAL) file shared by every worker process on a host
+
+    Same interface as SessionStore. append() only queues the exchange in memory; a
+    background thread writes queued exchanges in one transaction every flush_interval
+    seconds, so a chat turn never waits on disk. get() merges what is on disk with
+    this process's unflushed exchanges, so a worker always sees its own writes and sees
+    other workers' writes after at most one flush interval.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS exchanges (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            origin TEXT NOT NULL,
+            ts REAL NOT NULL,
+            payload TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS exchanges_session ON exchanges (session_id, id);
+        CREATE INDEX IF NOT EXISTS exchanges_ts ON exchanges (ts);
+    """
+
+    def __init__(self, path, max_sessions=10000, ttl_seconds=1800, max_history=10,
+                 flush_interval=0.05, sweep_interval=10.0, max_pending=256):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_history = max_history
+        self.flush_interval = flush_interval
+        self.sweep_interval = sweep_interval
+        self.max_pending = max_pending
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # one flush at a time (flush thread, clear(), atexit)
+        self._pending = []   # (session_id, origin, ts, payload) waiting for the next flush
+        self._inflight = []  # batch being written right now
+        self._seq = 0
+        self._pid = None
+        self._local = threading.local()
+        self._wake = threading.Event()
+        self._last_sweep = 0.0
+        self.flushes = 0
+        self.flushed_exchanges = 0
+        self.lru_evictions = 0
+        self.ttl_evictions = 0
+
+        self._connect().executescript(self._SCHEMA)
+        atexit.register(self.flush)
+
+    def _connect(self):
+        """Get this thread's connection (connections are not shared across forks or threads)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _ensure_flusher(self):
+        # Started lazily so each forked worker gets its own flush thread
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._pending = []
+            self._inflight = []
+            self._flush_lock = threading.Lock()  # may have been held by the parent's flusher at fork
+            threading.Thread(target=self._flush_loop, name='session-flush', daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"Session flush failed: {e}")
+
+    @staticmethod
+    def _encode(exchange):
+        return json.dumps(exchange, separators=(',', ':'), ensure_ascii=False)
+
+    def get(self, session_id):
+        """Get the conversation history for a session (empty if unknown or expired)"""
+        session_id = str(session_id)
+        cutoff = time.time() - self.ttl_seconds
+        # This process's exchanges that are not on disk yet, taken before the query: a batch
+        # committed in between is then in the rows, never missing from both
+        with self._lock:
+            local = [(origin, payload) for sid, origin, _, payload in self._inflight + self._pending
+                     if sid == session_id]
+        rows = self._connect().execute(
+            'SELECT origin, payload FROM exchanges WHERE session_id = ? AND ts >= ? ORDER BY id DESC LIMIT ?',
+            (session_id, cutoff, self.max_history)
+        ).fetchall()
+        rows.reverse()
+
+        if local:
+            flushed = {origin for origin, _ in rows}
+            rows.extend(row for row in local if row[0] not in flushed)
+
+        return [json.loads(payload) for _, payload in rows[-self.max_history:]]
+
+    def append(self, session_id, exchange):
+        """Queue an exchange for the next batched write"""
+        payload = self._encode(exchange)
+        with self._lock:
+            self._ensure_flusher()
+            self._seq += 1
+            self._pending.append((str(session_id), f'{self._pid}:{self._seq}', time.time(), payload))
+            pending = len(self._pending)
+        if pending >= self.max_pending:
+            self._wake.set()
+
+    def clear(self, session_id):
+        """Forget a session"""
+        self.flush()
+        self._connect().execute('DELETE FROM exchanges WHERE session_id = ?', (str(session_id),))
+
+    def flush(self):
+        """Write queued exchanges in one transaction and trim the touched sessions"""
+        with self._flush_lock:
+            self._flush()
+
+    def _flush(self):
+        with self._lock:
+            if not self._pending:
+                batch = None
+            else:
+                batch = self._inflight = self._pending
+                self._pending = []
+
+        now = time.time()
+        conn = self._connect()
+        try:
+            if batch:
+                conn.execute('BEGIN IMMEDIATE')
+                conn.executemany(
+                    'INSERT INTO exchanges (session_id, origin, ts, payload) VALUES (?, ?, ?, ?)', batch
+                )
+                # Keep only the last max_history exchanges of each touched session
+                conn.executemany(
+                    'DELETE FROM exchanges WHERE session_id = ? AND id NOT IN '
+                    '(SELECT id FROM exchanges WHERE session_id = ? ORDER BY id DESC LIMIT ?)',
+                    [(sid, sid, self.max_history) for sid in {row[0] for row in batch}]
+                )
+                conn.execute('COMMIT')
+                self.flushes += 1
+                self.flushed_exchanges += len(batch)
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            # Put the batch back so it is retried on the next flush
+            with self._lock:
+                self._pending = batch + self._pending
+            raise
+        finally:
+            if batch:
+                with self._lock:
+                    self._inflight = []
+
+        if now - self._last_sweep >= self.sweep_interval:
+            self._last_sweep = now
+            self._sweep(conn, now)
+
+    def _sweep(self, conn, now):
+        """Drop idle sessions and the least recently used ones beyond max_sessions"""
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            expired = conn.execute(
+                'SELECT session_id FROM exchanges GROUP BY session_id HAVING MAX(ts) < ?',
+                (now - self.ttl_seconds,)
+            ).fetchall()
+            conn.executemany('DELETE FROM exchanges WHERE session_id = ?', expired)
+            evicted = conn.execute(
+                'SELECT session_id FROM exchanges GROUP BY session_id ORDER BY MAX(ts) DESC LIMIT -1 OFFSET ?',
+                (self.max_sessions,)
+            ).fetchall()
+            conn.executemany('DELETE FROM exchanges WHERE session_id = ?', evicted)
+            conn.execute('COMMIT')
+        except sqlite3.Error:
+            conn.execute('ROLLBACK')
+            raise
+        self.ttl_evictions += len(expired)
+        self.lru_evictions += len(evicted)
+
+    def __len__(self):
+        row = self._connect().execute('SELECT COUNT(DISTINCT session_id) FROM exchanges').fetchone()
+        return row[0]
+
+    def stats(self):
+        """Get session count, write batching and eviction counters"""
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            'backend': 'sqlite',
+            'sessions': len(self),
+            'max_sessions': self.max_sessions,
+            'ttl_seconds': self.ttl_seconds,
+            'pending_writes': pending,
+            'flushes': self.flushes,
+            'flushed_exchanges': self.flushed_exchanges,
+            'lru_evictions': self.lru_evictions,
+            'ttl_evictions': self.ttl_evictions
+        }
+
+
+def create_session_store(backend='memory', **options):
+    """Create the conversation history backend
+
+    'memory' keeps sessions in this process (SessionStore); 'sqlite' shares them between
+    worker processes on one host through a WAL database at options['path']
+    (SQLiteSessionStore). Both expose get(), append(), clear() and stats().
+    """
+    if backend == 'memory':
+        options.pop('path', None)
+        return SessionStore(**options)
+    if backend == 'sqlite':
+        return SQLiteSessionStore(**options)
+    raise ValueError(f"Unknown session backend: {backend}")